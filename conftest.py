@@ -0,0 +1,10 @@
+import pytest
+
+from core.test_runner import isolated_cache
+
+
+@pytest.fixture(autouse=True, scope='session')
+def _isolated_cache():
+    """pytest не использует TEST_RUNNER: кэш изолируется здесь."""
+    with isolated_cache():
+        yield
@@ -0,0 +1,250 @@
+"""Версии (поколения) закэшированных данных.
+
+Версия - случайный токен в кэше. Ключи закэшированных фрагментов
+и страниц включают версии данных, из которых они собраны: смена версии
+делает старые записи недостижимыми, и они вытесняются сами.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+VERSION_PREFIX = 'version:'
+# Сколько секунд после истечения можно отдавать устаревшую страницу,
+# пока ее пересчитывает другой запрос
+STALE_TIME = 60
+# Сколько секунд живет блокировка пересчета страницы
+LOCK_TIME = 30
+# Сколько секунд ждать страницу, которую уже строит другой запрос,
+# и как часто проверять, готова ли она
+LOCK_WAIT = 2
+LOCK_POLL = 0.05
+# Насколько рано пересчитывать страницу (XFetch): больше - раньше
+XFETCH_BETA = 1.0
+# Счетчики кэша страниц: hit - свежая копия, miss - построена заново,
+# early - пересчитана до истечения, expired - после истечения,
+# stale - отдана устаревшая копия, wait - дождались чужого пересчета
+PAGE_CACHE_STATES = ('hit', 'miss', 'early', 'expired', 'stale', 'wait')
+STATS_PREFIX = 'page_cache_stats:'
+STATS_FLUSH_TIME = 10
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_flushed_at = 0
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def version_key(name):
+    # Слаги и имена пользователей могут быть не ASCII
+    return VERSION_PREFIX + quote(name, safe=':')
+
+
+def get_versions(names):
+    """Текущие версии для имен names: {имя: токен}."""
+    keys = {version_key(name): name for name in names}
+    versions = {
+        keys[key]: version for key, version in cache.get_many(keys).items()
+    }
+    for key, name in keys.items():
+        if name not in versions:
+            cache.add(key, new_version(), None)
+            versions[name] = cache.get(key)
+    return versions
+
+
+def get_version(name):
+    return get_versions([name])[name]
+
+
+def bump_versions(*names):
+    cache.set_many(
+        {version_key(name): new_version() for name in names}, None
+    )
+
+
+def scope_names(request, scopes, kwargs):
+    """Имена версий scopes: строки форматируются аргументами
+    представления и user_id, функции scope(request, **kwargs) возвращают
+    список имен. Запоминаются в запросе вместе с версиями."""
+    known = request.__dict__.setdefault('_cache_scope_names', {})
+    if scopes not in known:
+        names = []
+        for scope in scopes:
+            if callable(scope):
+                names.extend(scope(request, **kwargs))
+            else:
+                names.append(scope.format(user_id=request.user.pk, **kwargs))
+        known[scopes] = names
+    return known[scopes]
+
+
+def scope_versions(request, scopes, kwargs):
+    """Версии scopes для запроса. Запоминаются в запросе: проверка
+    условного запроса и кэш страницы читают их из кэша один раз."""
+    names = scope_names(request, scopes, kwargs)
+    known = request.__dict__.setdefault('_cache_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update(get_versions(missing))
+    return [known[name] for name in names]
+
+
+def page_etag(request, versions):
+    """ETag страницы: версии ее данных, пользователь и URL."""
+    raw = ':'.join([*versions, str(request.user.pk), request.get_full_path()])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def condition_versioned(*scopes):
+    """Отвечает 304 на If-None-Match по версиям scopes, не вызывая
+    представление. Last-Modified не выставляется: секундная точность
+    пропустила бы смену версии в ту же секунду."""
+    return condition(
+        etag_func=lambda request, *args, **kwargs: page_etag(
+            request, scope_versions(request, scopes, kwargs)
+        )
+    )
+
+
+def page_cache_key(view, request, versions):
+    """Ключ страницы: представление, версии данных, пользователь и URL.
+    Страницы различаются по пользователю, а не по сессии."""
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'page:{}.{}:{}:{}:{}'.format(
+        view.__module__, view.__name__, ':'.join(versions),
+        request.user.pk or 'anon', path
+    )
+
+
+def recompute_early(expires, delta, now, beta=XFETCH_BETA):
+    """XFetch: вероятность пересчитать страницу до истечения растет
+    по мере приближения к нему и с временем построения страницы delta."""
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def count_page_cache(name):
+    """Счетчики попаданий копятся в процессе и раз в STATS_FLUSH_TIME
+    секунд прибавляются к общим счетчикам в кэше."""
+    global _stats_flushed_at
+    with _stats_lock:
+        _stats[name] += 1
+        if time.monotonic() - _stats_flushed_at < STATS_FLUSH_TIME:
+            return
+        _stats_flushed_at = time.monotonic()
+    flush_page_cache_stats()
+
+
+def flush_page_cache_stats():
+    with _stats_lock:
+        counts = dict(_stats)
+        _stats.clear()
+    for name, value in counts.items():
+        key = STATS_PREFIX + name
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # Счетчик вытеснен между add и incr
+            cache.set(key, value, None)
+
+
+def get_page_cache_stats():
+    """Общие для всех процессов счетчики кэша страниц."""
+    flush_page_cache_stats()
+    keys = {STATS_PREFIX + name: name for name in PAGE_CACHE_STATES}
+    return {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+
+
+def wait_for_page(key):
+    """Ждет до LOCK_WAIT секунд страницу, которую строит другой запрос."""
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def lookup_page(key, lock):
+    """(закэшированный ответ или None, состояние, взята ли блокировка)."""
+    entry = cache.get(key)
+    now = time.time()
+    if entry is None:
+        if cache.add(lock, 1, LOCK_TIME):
+            return None, 'miss', True
+        entry = wait_for_page(key)
+        return (entry[0], 'wait', False) if entry else (None, 'miss', False)
+    response, expires, delta = entry
+    if now < expires and not recompute_early(expires, delta, now):
+        return response, 'hit', False
+    if cache.add(lock, 1, LOCK_TIME):
+        return None, 'early' if now < expires else 'expired', True
+    return response, 'hit' if now < expires else 'stale', False
+
+
+def get_or_build_page(key, timeout, build):
+    """Ответ из кэша или построенный build(), и состояние кэша."""
+    lock = key + ':lock'
+    response, state, locked = lookup_page(key, lock)
+    if response is not None:
+        return response, state
+    started = time.time()
+    try:
+        response = build()
+        if response.status_code == 200 and not response.streaming:
+            cache.set(
+                key,
+                (response, time.time() + timeout, time.time() - started),
+                timeout + STALE_TIME
+            )
+    finally:
+        if locked:
+            cache.delete(lock)
+    return response, state
+
+
+def cache_page_versioned(timeout, *scopes):
+    """Кэширует GET-ответы представления на timeout секунд под ключом,
+    включающим версии scopes. Имена в scopes форматируются аргументами
+    представления и user_id: 'group_feed:{slug}', 'follow_feed:{user_id}',
+    или вычисляются функцией запроса (см. scope_names). bump_versions
+    для любого из них сразу делает закэшированные страницы недостижимыми.
+
+    Страницу пересчитывает один запрос, взявший блокировку: остальные
+    получают устаревшую копию (до STALE_TIME секунд после истечения)
+    или ждут новую. Незадолго до истечения страница пересчитывается
+    заранее с вероятностью XFetch. Заголовок X-Cache и счетчики
+    get_page_cache_stats() показывают, как был получен ответ.
+
+    Условные запросы проверяются по тем же версиям (condition_versioned)
+    до обращения к кэшу и представлению."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = page_cache_key(
+                view, request, scope_versions(request, scopes, kwargs)
+            )
+            response, state = get_or_build_page(
+                key, timeout, lambda: view(request, *args, **kwargs)
+            )
+            count_page_cache(state)
+            response['X-Cache'] = state.upper()
+            return response
+        return condition_versioned(*scopes)(wrapper)
+    return decorator
@@ -0,0 +1,281 @@
+"""Общий для всех процессов хоста кэш в файле SQLite (режим WAL).
+
+Воркеры gunicorn открывают один и тот же файл: запись, сделанная одним
+процессом, сразу видна остальным, а читатели не блокируют писателя.
+При переполнении вытесняются записи, к которым дольше всего
+не обращались (LRU по времени последнего чтения).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube_cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Сколько секунд ждать блокировку записи другого процесса
+BUSY_TIMEOUT = 5
+# Время чтения обновляется не чаще раза в столько секунд: иначе каждое
+# чтение превращалось бы в запись
+ACCESS_RESOLUTION = 1
+# Как часто (в записях) проверять переполнение кэша
+CULL_CHECK_EVERY = 100
+# Предел числа параметров одного запроса SQLite
+MAX_PARAMS = 900
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+    ' expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+# Счетчики обращений по файлам кэша, общие для потоков процесса
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def chunks(items, size=MAX_PARAMS):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = os.path.abspath(location)
+        self._local = threading.local()
+        self._sets = 0
+        with _stats_lock:
+            self.stats = _stats.setdefault(self.location, Counter())
+
+    @property
+    def connection(self):
+        """Свое соединение у каждого потока и каждого процесса:
+        соединение, унаследованное при fork, использовать нельзя."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.location), exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=BUSY_TIMEOUT, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def count(self, name, value=1):
+        with _stats_lock:
+            self.stats[name] += value
+
+    def get_stats(self):
+        """Счетчики этого процесса и текущее число записей."""
+        stats = dict(self.stats)
+        stats['entries'] = self.connection.execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()[0]
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = stats.get('hits', 0) / lookups if lookups else 0
+        return stats
+
+    def key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def fetch(self, keys):
+        """{ключ: значение} для живых записей keys."""
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in chunks(keys):
+            rows = self.connection.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                'WHERE key IN ({})'.format(', '.join('?' * len(chunk))),
+                chunk
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = pickle.loads(value)
+                if now - accessed > ACCESS_RESOLUTION:
+                    stale.append((now, key))
+        if stale:
+            self.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale
+            )
+        self.count('hits', len(found))
+        self.count('misses', len(keys) - len(found))
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.key(key, version)
+        return self.fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.key(key, version): key for key in keys}
+        return {
+            keys[key]: value for key, value in self.fetch(list(keys)).items()
+        }
+
+    def store(self, rows):
+        """Записывает [(ключ, значение, timeout)] одной транзакцией."""
+        now = time.time()
+        rows = [
+            (key, pickle.dumps(value, self.pickle_protocol),
+             self.expires(timeout), now)
+            for key, value, timeout in rows
+        ]
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)', rows
+            )
+        self.count('sets', len(rows))
+        self.maybe_cull(len(rows))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.store([(self.key(key, version), value, timeout)])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.store([
+            (self.key(key, version), value, timeout)
+            for key, value in data.items()
+        ])
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Атомарно для всех процессов: запись добавляется, только если
+        ключа нет или он истек."""
+        now = time.time()
+        cursor = self.connection.execute(
+            'INSERT INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (self.key(key, version),
+             pickle.dumps(value, self.pickle_protocol),
+             self.expires(timeout), now, now)
+        )
+        added = cursor.rowcount > 0
+        if added:
+            self.count('sets')
+            self.maybe_cull()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно для всех процессов, в отличие от BaseCache.incr."""
+        key = self.key(key, version)
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)', (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, self.pickle_protocol), key)
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.expires(timeout), self.key(key, version), time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.key(key, version) for key in keys]
+        with self.transaction() as connection:
+            for chunk in chunks(keys):
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ({})'.format(
+                        ', '.join('?' * len(chunk))
+                    ), chunk
+                )
+        self.count('deletes', len(keys))
+
+    def has_key(self, key, version=None):
+        return self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.key(key, version), time.time())
+        ).fetchone() is not None
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def transaction(self):
+        return TransactionContext(self.connection)
+
+    def maybe_cull(self, added=1):
+        self._sets += added
+        if self._sets < CULL_CHECK_EVERY:
+            return
+        self._sets = 0
+        self.cull()
+
+    def cull(self):
+        """Удаляет истекшие записи, а если их не хватило - давно
+        не читавшиеся, оставляя (1 - 1/CULL_FREQUENCY) от MAX_ENTRIES."""
+        connection = self.connection
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        with self.transaction():
+            expired = connection.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+            ).rowcount
+            excess = count - expired - (
+                self._max_entries - self._max_entries // self._cull_frequency
+            )
+            evicted = 0
+            if excess > 0:
+                evicted = connection.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                    'ORDER BY accessed LIMIT ?)', (excess,)
+                ).rowcount
+        self.count('expired', expired)
+        self.count('evictions', evicted)
+
+
+class TransactionContext:
+    """BEGIN IMMEDIATE ... COMMIT: блокировка записи берется сразу,
+    а не при первом изменении, так что параллельные транзакции
+    ждут busy_timeout, а не получают SQLITE_BUSY посреди работы."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,22 @@
+"""Настройка соединений SQLite: PRAGMA из SQLITE_PRAGMAS выполняются
+для каждого нового соединения (сигнал connection_created).
+
+WAL позволяет читателям не ждать писателя, synchronous=NORMAL в WAL
+не теряет согласованность при сбое, mmap_size и cache_size уменьшают
+число системных вызовов чтения, busy_timeout заставляет ждать
+блокировку записи вместо ошибки database is locked.
+"""
+from django.conf import settings
+
+
+def apply_pragmas(connection, pragmas):
+    """Выполняет PRAGMA на соединении DB-API sqlite3 или курсоре Django."""
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
@@ -0,0 +1,98 @@
+"""Чтение с реплик и запись в основную базу.
+
+Представления, отмеченные use_replica, читают с одной из реплик
+DATABASE_REPLICAS; все остальные запросы и любые записи идут
+в основную базу. После записи PinPrimaryMiddleware ставит cookie
+на REPLICA_PIN_TIME секунд: пока она есть, пользователь читает
+из основной базы и видит свои изменения, даже если реплика отстала.
+
+Страницы, которые кэширует cache_page_versioned, собираются из основной
+базы: страница с отставшей реплики попала бы в кэш под уже новой
+версией и жила бы до истечения кэша.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+PIN_COOKIE = 'use_primary'
+# Сессии и пользователи читаются из основной базы: вход не должен
+# теряться из-за отставания реплики
+PRIMARY_APPS = {'auth', 'sessions'}
+
+# Запросы, после которых пользователь закрепляется за основной базой.
+# db_for_write для этого не годится: get_or_create спрашивает базу
+# для записи, даже когда строка уже есть
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_state = threading.local()
+
+
+def mark_writes(execute, sql, params, many, context):
+    """execute_wrapper основной базы: отмечает выполненную запись."""
+    if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        _state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def use_replica(view):
+    """Запросы на чтение в представлении идут на реплику."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _state.use_replica = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.use_replica = False
+    return wrapper
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS
+                or not getattr(_state, 'use_replica', False)
+                or getattr(_state, 'pinned', False)
+                or model._meta.app_label in PRIMARY_APPS
+                # Внутри транзакции видны только ее же изменения
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными основной базы
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PinPrimaryMiddleware:
+    """Читать из основной базы REPLICA_PIN_TIME секунд после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.pinned = PIN_COOKIE in request.COOKIES
+        _state.wrote = False
+        try:
+            with connections[PRIMARY].execute_wrapper(mark_writes):
+                response = self.get_response(request)
+        finally:
+            wrote, _state.pinned, _state.wrote = _state.wrote, False, False
+        if wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_TIME,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache_backends.SQLiteCache',
+}
+# Размер значения: примерно одна закэшированная карточка поста
+VALUE_SIZE = 2000
+
+
+def create_cache(name, directory, entries):
+    location = os.path.join(directory, name)
+    if name == 'sqlite':
+        location += '.sqlite3'
+    return import_string(BACKENDS[name])(
+        location, {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': entries * 2}}
+    )
+
+
+def worker(name, directory, keys, number, workers, barrier, results):
+    """Процесс-воркер: записывает свою долю ключей, ждет остальных
+    и читает все ключи вперемешку."""
+    cache = create_cache(name, directory, len(keys))
+    value = 'x' * VALUE_SIZE
+    own = keys[number::workers]
+    started = time.perf_counter()
+    for key in own:
+        cache.set(key, value)
+    write_time = time.perf_counter() - started
+    barrier.wait()
+    reads = random.Random(number).sample(keys, len(keys))
+    hits = 0
+    started = time.perf_counter()
+    for key in reads:
+        hits += cache.get(key) is not None
+    read_time = time.perf_counter() - started
+    results.put((len(own), write_time, len(reads), read_time, hits))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша: скорость записи и чтения из нескольких '
+        'процессов и долю попаданий в записи других процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--backends', nargs='+', default=list(BACKENDS),
+            choices=list(BACKENDS)
+        )
+
+    def handle(self, *args, **options):
+        keys = [f'bench:{i}' for i in range(options['keys'])]
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(
+            'бэкенд     запись_оп/с  чтение_оп/с  попаданий'
+        )
+        for name in options['backends']:
+            directory = tempfile.mkdtemp(prefix='bench_cache_')
+            try:
+                barrier = context.Barrier(workers)
+                results = context.Queue()
+                processes = [
+                    context.Process(target=worker, args=(
+                        name, directory, keys, number, workers, barrier,
+                        results
+                    ))
+                    for number in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                rows = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            finally:
+                shutil.rmtree(directory)
+            writes, write_time, reads, read_time, hits = (
+                sum(column) for column in zip(*rows)
+            )
+            # Время воркеров суммируется: это пропускная способность
+            # одного процесса, умноженная на число процессов
+            self.stdout.write(
+                f'{name:<10} {writes * workers / write_time:>11.0f}  '
+                f'{reads * workers / read_time:>11.0f}  '
+                f'{hits / reads:>9.0%}'
+            )
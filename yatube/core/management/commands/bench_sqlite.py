@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+# (PRAGMA, новое соединение на каждую операцию)
+PROFILES = {
+    'default': ({}, True),
+    'pragmas': (None, True),
+    'persistent': (None, False),
+}
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_author_pub_date ON post (author_id, pub_date)',
+)
+# Читатель: страница ленты автора, писатель: новый пост
+READ_SQL = (
+    'SELECT id, text, pub_date FROM post WHERE author_id = ? '
+    'ORDER BY pub_date DESC LIMIT 10'
+)
+WRITE_SQL = 'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)'
+AUTHORS = 100
+TEXT = 'x' * 300
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path)
+    apply_pragmas(connection, pragmas)
+    return connection
+
+
+def create_database(path, pragmas, rows):
+    connection = connect(path, pragmas)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    with connection:
+        connection.executemany(WRITE_SQL, (
+            (number % AUTHORS, TEXT, number) for number in range(rows)
+        ))
+    connection.close()
+
+
+def worker(path, role, pragmas, reconnect, duration, barrier, results):
+    """Процесс-воркер: duration секунд читает или пишет и сообщает
+    число операций и ошибок database is locked."""
+    operations = locked = 0
+    connection = None
+    barrier.wait()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if connection is None:
+            connection = connect(path, pragmas)
+        try:
+            if role == 'read':
+                connection.execute(
+                    READ_SQL, (operations % AUTHORS,)
+                ).fetchall()
+            else:
+                with connection:
+                    connection.execute(
+                        WRITE_SQL, (operations % AUTHORS, TEXT, time.time())
+                    )
+            operations += 1
+        except sqlite3.OperationalError:
+            locked += 1
+        if reconnect:
+            connection.close()
+            connection = None
+    results.put((role, operations, locked))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite для параллельных '
+        'читателей и писателей: без PRAGMA, с SQLITE_PRAGMAS и с '
+        'SQLITE_PRAGMAS и постоянными соединениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument(
+            '--profiles', nargs='+', default=list(PROFILES),
+            choices=list(PROFILES)
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        roles = (
+            ['read'] * options['readers'] + ['write'] * options['writers']
+        )
+        self.stdout.write(
+            'профиль       чтений/с  записей/с  блокировок'
+        )
+        for name in options['profiles']:
+            pragmas, reconnect = PROFILES[name]
+            if pragmas is None:
+                pragmas = settings.SQLITE_PRAGMAS
+            directory = tempfile.mkdtemp(prefix='bench_sqlite_')
+            try:
+                path = os.path.join(directory, 'bench.sqlite3')
+                create_database(path, pragmas, options['rows'])
+                barrier = context.Barrier(len(roles))
+                results = context.Queue()
+                processes = [
+                    context.Process(target=worker, args=(
+                        path, role, pragmas, reconnect,
+                        options['duration'], barrier, results
+                    ))
+                    for role in roles
+                ]
+                for process in processes:
+                    process.start()
+                rows = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            finally:
+                shutil.rmtree(directory)
+            totals = {'read': 0, 'write': 0}
+            locked = 0
+            for role, operations, errors in rows:
+                totals[role] += operations
+                locked += errors
+            self.stdout.write(
+                f'{name:<12} {totals["read"] / options["duration"]:>9.0f}  '
+                f'{totals["write"] / options["duration"]:>9.0f}  '
+                f'{locked:>10}'
+            )
@@ -0,0 +1,20 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from core.cache import PAGE_CACHE_STATES, get_page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит счетчики кэша страниц, общие для всех воркеров'
+
+    def handle(self, *args, **options):
+        stats = get_page_cache_stats()
+        total = sum(stats.values())
+        for state in PAGE_CACHE_STATES:
+            value = stats.get(state, 0)
+            share = value / total if total else 0
+            self.stdout.write(f'{state:<8} {value:>10}  {share:>6.1%}')
+        if hasattr(cache, 'get_stats'):
+            self.stdout.write('бэкенд (этот процесс):')
+            for name, value in sorted(cache.get_stats().items()):
+                self.stdout.write(f'  {name:<10} {value}')
@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик через backup API: '
+        'локальная замена репликации для проверки чтения с реплик'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять копирование раз в столько секунд '
+                 '(0 - скопировать один раз)'
+        )
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('DATABASE_REPLICAS пуст')
+        for alias in ('default', *settings.DATABASE_REPLICAS):
+            if 'sqlite3' not in databases[alias]['ENGINE']:
+                raise CommandError(f'{alias}: поддерживается только SQLite')
+        while True:
+            started = time.monotonic()
+            self.replicate(databases)
+            self.stdout.write(
+                f'Реплики обновлены за {time.monotonic() - started:.2f} с'
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def replicate(self, databases):
+        # backup копирует согласованный снимок, не останавливая записи
+        # в основную базу, и блокирует реплику только на время копирования
+        source = sqlite3.connect(databases['default']['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(databases[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
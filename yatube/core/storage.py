@@ -0,0 +1,104 @@
+"""Хранилище с адресацией по содержимому.
+
+Файл получает имя по SHA-256 содержимого и кладется в подкаталоги
+по первым символам хэша: posts/ab/cd/abcd....jpg. Повторная загрузка
+того же файла не пишет новую копию, а увеличивает счетчик ссылок
+StoredFile; delete() уменьшает его и удаляет файл с последней ссылкой.
+Проверка и запись файла, как и его удаление, выполняются под
+блокировкой строки StoredFile, так что они не пересекаются.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredFile
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        """Каталог upload_to, подкаталоги по хэшу и расширение name."""
+        directory, basename = posixpath.split(name.replace('\\', '/'))
+        digest = content_hash(content)
+        extension = os.path.splitext(basename)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def is_hashed(self, name):
+        """Имя уже построено hashed_name."""
+        parts = name.split('/')
+        digest = os.path.splitext(parts[-1])[0]
+        return (
+            len(parts) >= 3 and len(digest) == 64
+            and parts[-3:-1] == [digest[:2], digest[2:4]]
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        with transaction.atomic():
+            # Ссылка добавляется до проверки файла: delete() последней
+            # ссылки ждет этой транзакции или уже удалил файл
+            self.add_refs(name, 1, content.size)
+            if not self.exists(name):
+                saved = self._save(name, content)
+                if saved != name:
+                    # Ту же загрузку одновременно сохранил другой процесс
+                    super().delete(saved)
+        return name
+
+    def add_refs(self, name, count, size=None):
+        """Добавляет count ссылок на файл name. UPDATE идет первым
+        и блокирует строку до конца транзакции."""
+        with transaction.atomic():
+            if StoredFile.objects.filter(name=name).update(
+                    refs=F('refs') + count):
+                return
+            try:
+                with transaction.atomic():
+                    StoredFile.objects.create(
+                        name=name, refs=count,
+                        size=self.size(name) if size is None else size
+                    )
+            except IntegrityError:
+                # Строку одновременно создала другая загрузка
+                StoredFile.objects.filter(name=name).update(
+                    refs=F('refs') + count
+                )
+
+    def delete(self, name):
+        """Снимает одну ссылку, файл удаляется вместе с последней.
+        Файлы, сохраненные до хранилища, удаляются сразу."""
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if stored and stored.refs > 1:
+                StoredFile.objects.filter(name=name).update(
+                    refs=F('refs') - 1
+                )
+                return
+            StoredFile.objects.filter(name=name).delete()
+            # Под той же блокировкой: save() того же содержимого
+            # дождется ее и запишет файл заново
+            super().delete(name)
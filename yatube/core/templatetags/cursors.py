@@ -0,0 +1,22 @@
+from django import template
+
+from core.utils import object_cursor
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page):
+    """Курсор следующей страницы для страницы с номером или None."""
+    fields = getattr(page.paginator, 'cursor_fields', None)
+    if not fields or not page.has_next() or not page.object_list:
+        return None
+    return object_cursor(page.object_list[-1], fields)
+
+
+@register.filter
+def previous_cursor(page):
+    fields = getattr(page.paginator, 'cursor_fields', None)
+    if not fields or not page.has_previous() or not page.object_list:
+        return None
+    return object_cursor(page.object_list[0], fields)
@@ -0,0 +1,32 @@
+"""Тесты очищают кэш: каждый запуск получает свой файл кэша, чтобы
+не стирать кэш запущенного сервера и не видеть записи прошлых запусков."""
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_cache():
+    """Кэш по умолчанию - тот же бэкенд в файле во временном каталоге."""
+    with tempfile.TemporaryDirectory() as directory:
+        default = dict(
+            settings.CACHES['default'],
+            LOCATION=os.path.join(directory, 'cache.sqlite3')
+        )
+        with override_settings(CACHES={**settings.CACHES, 'default': default}):
+            yield
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache = ExitStack()
+        self._cache.enter_context(isolated_cache())
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache.close()
+        super().teardown_test_environment(**kwargs)
@@ -1,7 +1,256 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
 
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
 
-def get_page_obj(query_set, rec_on_page, request):
-    paginator = Paginator(query_set, rec_on_page)
+# Поля ключа курсорной паджинации: дата и поле, различающее записи
+# с одинаковой датой
+CURSOR_FIELDS = ('pub_date', 'pk')
+# Сколько секунд закэшированное число записей считается свежим
+COUNT_FRESH_TIME = 60
+# Сколько секунд устаревшее число записей еще можно показывать
+COUNT_CACHE_TIME = 60 * 60 * 24
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW = 3
+
+
+def encode_cursor(value, pk):
+    """Непрозрачный токен позиции в ленте: (значение поля, id)."""
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (значение поля, id) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = raw.decode().split('|')
+        return datetime.fromisoformat(value), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def object_cursor(obj, fields):
+    """Токен позиции записи obj в ленте, упорядоченной по fields."""
+    field, tiebreak = fields
+    return encode_cursor(getattr(obj, field), getattr(obj, tiebreak))
+
+
+def seek(query_set, fields, after=None, before=None, limit=None):
+    """Первые limit строк после позиции after по убыванию ключа fields,
+    а если задана позиция before - строки перед ней по возрастанию."""
+    field, pk = fields
+    if before:
+        value, key = before
+        return list(
+            query_set.filter(
+                Q(**{f'{field}__gt': value})
+                | Q(**{field: value, f'{pk}__gt': key})
+            ).order_by(field, pk)[:limit]
+        )
+    if after:
+        value, key = after
+        query_set = query_set.filter(
+            Q(**{f'{field}__lt': value})
+            | Q(**{field: value, f'{pk}__lt': key})
+        )
+    return list(query_set.order_by(f'-{field}', f'-{pk}')[:limit])
+
+
+def is_seekable(object_list):
+    """Можно ли листать object_list по ключу: QuerySet или лента
+    с методом seek(after, before, limit)."""
+    return isinstance(object_list, QuerySet) or hasattr(object_list, 'seek')
+
+
+class CursorPage(Page):
+    """Страница ленты, полученная поиском по ключу, а не OFFSET."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def cursor(self, obj):
+        return object_cursor(obj, self.paginator.fields)
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (дата, id): стоимость страницы не зависит
+    от ее глубины, COUNT(*) не выполняется."""
+
+    def __init__(self, object_list, per_page, fields=CURSOR_FIELDS):
+        super().__init__(object_list, per_page)
+        self.fields = fields
+
+    def get_page(self, after=None, before=None):
+        after = after and decode_cursor(after)
+        before = before and decode_cursor(before)
+        limit = self.per_page + 1
+        if isinstance(self.object_list, QuerySet):
+            rows = seek(self.object_list, self.fields, after, before, limit)
+        else:
+            rows = self.object_list.seek(after, before, limit)
+        if before:
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+        return CursorPage(
+            rows[:self.per_page], self, len(rows) > self.per_page, bool(after)
+        )
+
+
+class CachedCountPaginator(Paginator):
+    """Паджинатор без COUNT(*) на каждый запрос: число записей берется
+    из кэша и обновляется в фоне, наличие следующей страницы определяется
+    по одной лишней строке выборки."""
+
+    def __init__(self, object_list, per_page, *args, **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        # Номер запрошенной страницы и есть ли записи после нее
+        self.number = None
+        self.has_more = False
+        # Поля курсора: соседние страницы открываются по ключу, а не OFFSET
+        self.cursor_fields = None
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        self.number = number
+        self.has_more = len(rows) > self.per_page
+        self.__dict__.pop('num_pages', None)
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def get_page(self, number):
+        try:
+            number = self.validate_number(number)
+        except (PageNotAnInteger, EmptyPage):
+            number = 1
+        try:
+            return self.page(number)
+        except EmptyPage:
+            # Номер за концом ленты: переходим на последнюю страницу
+            # по свежему числу записей, кэш мог устареть
+            count = (
+                self.refresh_count(self.count_cache_key())
+                if isinstance(self.object_list, QuerySet)
+                else len(self.object_list)
+            )
+            return self.page(max(1, math.ceil(count / self.per_page)))
+
+    @cached_property
+    def num_pages(self):
+        """Оценка числа страниц, согласованная с полученной страницей:
+        без следующей страницы COUNT(*) не нужен вовсе."""
+        if self.number is not None and not self.has_more:
+            return self.number
+        pages = math.ceil(self.count / self.per_page)
+        if self.number is not None:
+            pages = max(pages, self.number + 1)
+        return max(1, pages)
+
+    @property
+    def page_window(self):
+        """Первая, текущая ± PAGE_WINDOW и последняя страницы;
+        None обозначает пропуск."""
+        number, last = self.number or 1, self.num_pages
+        window = range(
+            max(1, number - PAGE_WINDOW), min(last, number + PAGE_WINDOW) + 1
+        )
+        pages = []
+        if window[0] > 1:
+            pages.append(1)
+            if window[0] > 2:
+                pages.append(None)
+        pages.extend(window)
+        if window[-1] < last:
+            if window[-1] < last - 1:
+                pages.append(None)
+            pages.append(last)
+        return pages
+
+    def count_cache_key(self):
+        query = str(self.object_list.query).encode()
+        return 'paginator_count:' + hashlib.md5(query).hexdigest()
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return len(self.object_list)
+        key = self.count_cache_key()
+        cached = cache.get(key)
+        if cached is None:
+            return self.refresh_count(key)
+        count, counted_at = cached
+        if time.time() - counted_at > COUNT_FRESH_TIME and cache.add(
+                key + ':lock', 1, COUNT_FRESH_TIME):
+            threading.Thread(
+                target=self.refresh_count_in_thread, args=(key,), daemon=True
+            ).start()
+        return count
+
+    def refresh_count(self, key):
+        count = self.object_list.count()
+        cache.set(key, (count, time.time()), COUNT_CACHE_TIME)
+        return count
+
+    def refresh_count_in_thread(self, key):
+        try:
+            self.refresh_count(key)
+        finally:
+            cache.delete(key + ':lock')
+            connection.close()
+
+
+def get_page_obj(query_set, rec_on_page, request,
+                 cursor_fields=CURSOR_FIELDS):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if (after or before) and is_seekable(query_set):
+        paginator = CursorPaginator(query_set, rec_on_page, cursor_fields)
+        return paginator.get_page(after=after, before=before)
+    paginator = CachedCountPaginator(query_set, rec_on_page)
+    if is_seekable(query_set):
+        paginator.cursor_fields = cursor_fields
     page_namber = request.GET.get('page')
     return paginator.get_page(page_namber)
@@ -1,4 +1,29 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import ContentAddressedStorage
+
+# Заголовки, с которыми файл отдает фронтовой сервер, а не Django
+SENDFILE_HEADERS = {
+    'x-sendfile': 'X-Sendfile',
+    'x-accel-redirect': 'X-Accel-Redirect',
+}
+# Файлы с именем по содержимому никогда не меняются
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+media_storage = ContentAddressedStorage()
 
 
 def page_not_found(request, exception):
@@ -7,3 +32,125 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+class FileRange:
+    """Файл, из которого читается только length байт с позиции start.
+    Через fileno() и позицию файла WSGI-сервер с wsgi.file_wrapper
+    (gunicorn) отдает диапазон os.sendfile, без чтения в Python."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(начало, длина) единственного диапазона из заголовка Range.
+    None - заголовок не поддерживается и файл отдается целиком,
+    ValueError - диапазон за концом файла."""
+    match = RANGE_RE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: последние N байт
+        length = min(int(last), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    first = int(first)
+    if first >= size:
+        raise ValueError(header)
+    last = min(int(last), size - 1) if last else size - 1
+    if last < first:
+        return None
+    return first, last - first + 1
+
+
+def sendfile_response(path, full_path, content_type):
+    header = SENDFILE_HEADERS[settings.MEDIA_SENDFILE]
+    response = HttpResponse(content_type=content_type)
+    response[header] = (
+        full_path if header == 'X-Sendfile'
+        else settings.MEDIA_ACCEL_PREFIX + quote(path)
+    )
+    return response
+
+
+def file_response(request, full_path, size, etag, content_type):
+    """Файл целиком или диапазон из заголовка Range (206)."""
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    start, length = byte_range or (0, size)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        response = FileResponse(
+            FileRange(open(full_path, 'rb'), start, length),
+            content_type=content_type
+        )
+    if byte_range:
+        response.status_code = 206
+        end = start + length - 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдает файл из MEDIA_ROOT: через X-Sendfile/X-Accel-Redirect,
+    если задан MEDIA_SENDFILE, иначе сам, с поддержкой Range."""
+    try:
+        full_path = media_storage.path(path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404
+    etag = '"{:x}-{:x}"'.format(file_stat.st_mtime_ns, file_stat.st_size)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime)
+    )
+    if response is None:
+        content_type = (
+            mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        )
+        if settings.MEDIA_SENDFILE:
+            response = sendfile_response(path, full_path, content_type)
+        else:
+            response = file_response(
+                request, full_path, file_stat.st_size, etag, content_type
+            )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    if media_storage.is_hashed(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE
+        )
+    return response
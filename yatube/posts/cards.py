@@ -0,0 +1,51 @@
+"""Кэш готового HTML карточек постов.
+
+Ключ карточки содержит id поста и версии поста, его группы и автора,
+которые меняются при их сохранении. Страница ленты получает все
+карточки одним get_many и рендерит только недостающие.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.cache import get_versions
+
+from .thumbnails import prefetch_thumbnails
+
+CARD_TEMPLATE = 'includes/post_card.html'
+CARD_CACHE_TIME = 60 * 60 * 24
+
+
+def version_names(post):
+    return (
+        f'post:{post.pk}', f'group:{post.group_id}', f'user:{post.author_id}'
+    )
+
+
+def attach_cards(posts):
+    """Кладет в post.card HTML карточки для каждого поста из posts."""
+    versions = get_versions(
+        {name for post in posts for name in version_names(post)}
+    )
+    keys = {
+        post.pk: 'post_card:{}:{}'.format(
+            post.pk, ':'.join(versions[name] for name in version_names(post))
+        )
+        for post in posts
+    }
+    cards = cache.get_many(keys.values())
+    prefetch_thumbnails(
+        [post for post in posts if keys[post.pk] not in cards]
+    )
+    rendered = {}
+    for post in posts:
+        key = keys[post.pk]
+        if key not in cards:
+            cards[key] = render_to_string(CARD_TEMPLATE, {'post': post})
+            # Карточку с исходным изображением вместо миниатюры
+            # не кэшируем: миниатюра скоро будет готова
+            if post.thumbnail_ready:
+                rendered[key] = cards[key]
+        post.card = mark_safe(cards[key])
+    cache.set_many(rendered, CARD_CACHE_TIME)
+    return posts
@@ -0,0 +1,104 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются одним UPDATE с F()-выражением в обработчиках
+сигналов, поэтому их обновляют и представления, и админка, и каскадное
+удаление. Расхождения исправляет команда reconcile_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+AUTHOR_STATS_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def count_author_stats(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def get_author_stats(user):
+    """Счетчики пользователя одним чтением строки. Если строки еще нет,
+    счетчики считаются по базе и она создается."""
+    stats = AuthorStats.objects.filter(user_id=user.pk).first()
+    if stats is None:
+        stats, _ = AuthorStats.objects.get_or_create(
+            user_id=user.pk, defaults=count_author_stats(user.pk)
+        )
+    return stats
+
+
+def change_author_stats(user_id, field, delta):
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        # Счетчики без строки или ушедшие в ноль не трогаем:
+        # их исправит reconcile_counters
+        stats.filter(**{f'{field}__gte': -delta}).update(
+            **{field: F(field) + delta}
+        )
+        return
+    if not stats.update(**{field: F(field) + delta}):
+        # Строки счетчиков еще нет: событие уже в базе, считаем целиком
+        AuthorStats.objects.get_or_create(
+            user_id=user_id, defaults=count_author_stats(user_id)
+        )
+
+
+def change_comments_count(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def count_subquery(query_set, field):
+    return Coalesce(Subquery(
+        query_set.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def reconcile_author_stats(user_ids):
+    """Пересчитывает счетчики пользователей user_ids по базе.
+    Возвращает число исправленных строк."""
+    actual = User.objects.filter(pk__in=user_ids).annotate(
+        actual_posts=count_subquery(Post.objects, 'author'),
+        actual_followers=count_subquery(Follow.objects, 'author'),
+        actual_following=count_subquery(Follow.objects, 'user'),
+    ).values_list(
+        'pk', 'actual_posts', 'actual_followers', 'actual_following'
+    )
+    stored = AuthorStats.objects.in_bulk(user_ids)
+    created, changed = [], []
+    for pk, *counts in actual:
+        counts = dict(zip(AUTHOR_STATS_FIELDS, counts))
+        stats = stored.get(pk)
+        if stats is None:
+            created.append(AuthorStats(user_id=pk, **counts))
+        elif any(getattr(stats, field) != value
+                 for field, value in counts.items()):
+            for field, value in counts.items():
+                setattr(stats, field, value)
+            changed.append(stats)
+    AuthorStats.objects.bulk_create(created, ignore_conflicts=True)
+    AuthorStats.objects.bulk_update(changed, AUTHOR_STATS_FIELDS)
+    return len(created) + len(changed)
+
+
+def reconcile_comments_count(post_ids):
+    """Пересчитывает число комментариев постов post_ids по базе.
+    Возвращает число исправленных строк."""
+    changed = [
+        Post(pk=pk, comments_count=actual)
+        for pk, actual in Post.objects.filter(pk__in=post_ids).annotate(
+            actual=count_subquery(Comment.objects, 'post')
+        ).exclude(
+            comments_count=F('actual')
+        ).values_list('pk', 'actual')
+    ]
+    Post.objects.bulk_update(changed, ['comments_count'])
+    return len(changed)
@@ -0,0 +1,75 @@
+"""Выгрузка данных пользователя в NDJSON потоком.
+
+Записи читаются .iterator() пачками по EXPORT_CHUNK_SIZE через
+values_list, без создания моделей, и сразу превращаются в строки JSON,
+так что память не зависит от числа постов. Записи всех видов идут
+одним потоком, вид - в поле type, остальные поля совпадают с форматом
+import_yatube: выгрузку загружает import_yatube export <файл>.
+"""
+import json
+import zlib
+
+from .models import Comment, Follow, Post
+
+EXPORT_CHUNK_SIZE = 2000
+# Сколько байт строк копить перед отправкой: не отдавать
+# WSGI-серверу по строке
+BUFFER_SIZE = 64 * 1024
+
+
+def export_records(user):
+    """Посты, комментарии и подписки пользователя словарями."""
+    posts = Post.objects.filter(author=user).order_by('pk').values_list(
+        'pk', 'text', 'pub_date', 'group__slug', 'image'
+    )
+    for pk, text, pub_date, group, image in posts.iterator(
+            chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'post', 'id': pk, 'author': user.username,
+            'text': text, 'pub_date': pub_date.isoformat(),
+            'group': group, 'image': image or None
+        }
+    comments = Comment.objects.filter(author=user).order_by(
+        'pk'
+    ).values_list('post_id', 'text', 'created')
+    for post_id, text, created in comments.iterator(
+            chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'comment', 'post': post_id, 'author': user.username,
+            'text': text, 'created': created.isoformat()
+        }
+    follows = Follow.objects.filter(user=user).order_by('pk').values_list(
+        'author__username', flat=True
+    )
+    for author in follows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'follow', 'user': user.username, 'author': author}
+
+
+def export_lines(user):
+    """Байты NDJSON кусками примерно по BUFFER_SIZE."""
+    buffer = []
+    size = 0
+    for record in export_records(user):
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(chunks):
+    """Сжимает поток кусков в формат gzip по мере чтения."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(user, compress=False):
+    lines = export_lines(user)
+    return gzip_stream(lines) if compress else lines
@@ -0,0 +1,91 @@
+"""Прием загруженных изображений с ограниченным расходом памяти.
+
+Загрузки крупнее FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет на диск
+кусками. Размер и число пикселей проверяются по заголовку файла,
+до декодирования. Слишком большие снимки уменьшаются: JPEG
+декодируется сразу в уменьшенном масштабе (draft), остальные форматы
+допускаются к декодированию только до MAX_DECODE_PIXELS.
+"""
+import io
+import math
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Наибольший размер загружаемого файла в байтах
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# Наибольшее число пикселей снимка: 40-мегапиксельные фото проходят
+MAX_PIXELS = 50 * 10 ** 6
+# Сколько пикселей можно декодировать целиком (форматы без draft)
+MAX_DECODE_PIXELS = 16 * 10 ** 6
+# Форматы с кадрами анимации: такие файлы не пересобираются
+ANIMATED_FORMATS = ('GIF', 'WEBP', 'PNG')
+# MPO (снимки телефонов с несколькими кадрами) - это JPEG: draft
+# работает для первого кадра, он и сохраняется
+JPEG_FORMATS = ('JPEG', 'MPO')
+# Длинная сторона, до которой уменьшаются большие снимки
+MAX_SIDE = 2560
+JPEG_QUALITY = 90
+
+
+def open_upload(upload):
+    """Открывает загрузку Pillow без декодирования пикселей."""
+    if hasattr(upload, 'temporary_file_path'):
+        return Image.open(upload.temporary_file_path())
+    upload.seek(0)
+    return Image.open(upload)
+
+
+def ingest_image(upload):
+    """Проверяет загруженное изображение и уменьшает слишком большое.
+    Возвращает upload или новый файл с уменьшенным снимком."""
+    if upload.size > MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(size)d МБ.',
+            code='file_too_large',
+            params={'size': MAX_UPLOAD_SIZE // 1024 // 1024}
+        )
+    with open_upload(upload) as image:
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise ValidationError(
+                'Изображение больше %(pixels)d мегапикселей.',
+                code='too_many_pixels',
+                params={'pixels': MAX_PIXELS // 10 ** 6}
+            )
+        if max(width, height) <= MAX_SIDE:
+            return upload
+        if (image.format in ANIMATED_FORMATS
+                and getattr(image, 'is_animated', False)):
+            # Анимацию не пересобираем
+            return upload
+        return downscale(image, upload)
+
+
+def downscale(image, upload):
+    image_format = image.format
+    width, height = image.size
+    scale = MAX_SIDE / max(width, height)
+    size = (math.ceil(width * scale), math.ceil(height * scale))
+    if image_format in JPEG_FORMATS:
+        # Декодирование сразу в 1/2, 1/4 или 1/8 масштаба
+        image.draft('RGB', size)
+    elif width * height > MAX_DECODE_PIXELS:
+        raise ValidationError(
+            'Изображение этого формата больше %(pixels)d мегапикселей.',
+            code='too_many_pixels',
+            params={'pixels': MAX_DECODE_PIXELS // 10 ** 6}
+        )
+    # thumbnail уменьшает на месте, через reduce для больших кратностей;
+    # поворот по EXIF - уже на уменьшенной копии
+    image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    output = io.BytesIO()
+    if image_format in JPEG_FORMATS:
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(output, image_format)
+    return SimpleUploadedFile(
+        upload.name, output.getvalue(), upload.content_type
+    )
@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import reconcile_author_stats
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.timeline import DBTimeline
+
+USERNAME_PREFIX = 'bench_timeline_'
+POSTS_ON_PAGE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает усиление записи и время чтения ленты подписок '
+        'при разных порогах популярности автора. Все данные создаются '
+        'в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--authors', type=int, default=100)
+        parser.add_argument(
+            '--celebrities', type=int, default=3,
+            help='Сколько авторов читают все пользователи'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Сколько обычных авторов читает каждый пользователь'
+        )
+        parser.add_argument('--posts', type=int, default=5,
+                            help='Постов на автора')
+        parser.add_argument('--reads', type=int, default=200)
+        parser.add_argument(
+            '--thresholds', type=int, nargs='+',
+            default=[50, 200, 1000, 10 ** 9]
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with transaction.atomic():
+            users, posts = self.populate(options)
+            self.stdout.write(
+                'порог  популярных  строк_ленты  строк/пост  '
+                'запись_мс/пост  чтение_p50_мс  чтение_p95_мс'
+            )
+            for threshold in options['thresholds']:
+                self.run(threshold, users, posts, options['reads'])
+            transaction.set_rollback(True)
+
+    def populate(self, options):
+        User.objects.bulk_create(
+            User(username=f'{USERNAME_PREFIX}{i}')
+            for i in range(options['users'])
+        )
+        users = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).order_by('pk'))
+        authors = users[:options['authors']]
+        celebrities = authors[:options['celebrities']]
+        follows = []
+        for user in users:
+            followed = set(celebrities) | set(random.sample(
+                authors, min(options['follows'], len(authors))
+            ))
+            follows.extend(
+                Follow(user=user, author=author)
+                for author in followed if author != user
+            )
+        Follow.objects.bulk_create(follows)
+        reconcile_author_stats([user.pk for user in authors])
+        Post.objects.bulk_create(
+            (
+                Post(text=f'пост {i} автора {author.pk}', author=author)
+                for author in authors for i in range(options['posts'])
+            )
+        )
+        posts = list(Post.objects.filter(author__in=authors).order_by('pk'))
+        self.stdout.write(
+            f'пользователей: {len(users)}, подписок: {len(follows)}, '
+            f'постов: {len(posts)}'
+        )
+        return users, posts
+
+    def run(self, threshold, users, posts, reads):
+        TimelineEntry.objects.filter(user__in=users).delete()
+        cache.delete(f'timeline_celebrities:{threshold}')
+        timeline = DBTimeline(threshold=threshold)
+        started = time.perf_counter()
+        for post in posts:
+            timeline.push(post)
+        write_time = time.perf_counter() - started
+        rows = TimelineEntry.objects.filter(user__in=users).count()
+        timings = []
+        for user in random.sample(users, min(reads, len(users))):
+            started = time.perf_counter()
+            list(timeline.posts(user)[:POSTS_ON_PAGE])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{threshold:>5}  {len(timeline.celebrity_ids()):>10}  '
+            f'{rows:>11}  {rows / len(posts):>10.1f}  '
+            f'{write_time * 1000 / len(posts):>14.2f}  '
+            f'{statistics.median(timings):>13.2f}  '
+            f'{timings[int(len(timings) * 0.95) - 1]:>13.2f}'
+        )
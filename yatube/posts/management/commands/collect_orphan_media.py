@@ -0,0 +1,208 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.models import StoredFile
+from posts.models import Post
+from posts.thumbnails import fetch_kvstore, image_file
+from posts.timeline import batches
+
+# Сколько имен из Post.image читать одним запросом
+BATCH_SIZE = 1000
+# Как часто (в файлах) сохранять позицию обхода
+CHECKPOINT_EVERY = 1000
+# Файлы моложе этого возраста не трогаем: пост с ними может быть
+# еще не сохранен
+MIN_AGE = 3600
+
+
+def walk_sorted(root, directory='', start=''):
+    """Пути файлов под root/directory относительно root в том же
+    порядке, что и ORDER BY по строкам в базе. Пути не больше start
+    пропускаются вместе с целыми каталогами. В памяти только листинги
+    каталогов на текущем пути обхода."""
+    try:
+        with os.scandir(os.path.join(root, directory)) as scan:
+            # Каталог сортируется как 'имя/': все его файлы идут подряд
+            entries = sorted(
+                (entry.name + '/' if entry.is_dir(follow_symlinks=False)
+                 else entry.name, entry)
+                for entry in scan
+            )
+    except FileNotFoundError:
+        return
+    for key, entry in entries:
+        name = directory + key
+        if not key.endswith('/'):
+            if name > start:
+                yield name, entry
+        elif name > start or start.startswith(name):
+            yield from walk_sorted(root, name, start)
+
+
+def names_after(prefix, last):
+    """Следующая пачка имен изображений постов после last. Читается
+    по индексу post_image_idx: диапазон вместо LIKE, который SQLite
+    по индексу не выполняет."""
+    return (
+        Post.objects.filter(image__gt=max(last, prefix),
+                            image__lt=prefix + '\uffff')
+        .order_by('image').values_list('image', flat=True)
+        .distinct()[:BATCH_SIZE]
+    )
+
+
+def referenced_names(prefix, start):
+    """Отсортированные имена изображений постов, пачками по BATCH_SIZE."""
+    last = start
+    while True:
+        names = list(names_after(prefix, last))
+        if not names:
+            return
+        yield from names
+        last = names[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Находит и удаляет файлы изображений постов, на которые не '
+        'ссылается ни один пост, вместе с их миниатюрами sorl, и файлы '
+        'миниатюр, которых нет в KV-хранилище sorl. Дерево файлов '
+        'и отсортированные имена из базы обходятся слиянием, без загрузки '
+        'в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только вывести найденные файлы'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Не больше стольких файлов в секунду (0 - без ограничения)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с позицией обхода: прерванный запуск продолжится с нее'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд'
+        )
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        self.options = options
+        self.deadline = time.time() - options['min_age']
+        self.seen = self.orphans = self.size = 0
+        self.started = time.monotonic()
+        start = self.load_checkpoint(options['checkpoint'])
+        # Миниатюры (cache/) идут раньше изображений (posts/) в том же
+        # порядке строк, что и позиция в --checkpoint
+        self.collect_thumbnails(start)
+        self.collect_images(start)
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'Проверено файлов: {self.seen}. {action} ненужных: '
+            f'{self.orphans}, {self.size / 1024 / 1024:.1f} МБ'
+        )
+
+    def collect_images(self, start):
+        prefix = Post._meta.get_field('image').upload_to
+        references = referenced_names(prefix, start)
+        reference = next(references, None)
+        for name, entry in walk_sorted(self.storage.location, prefix, start):
+            while reference is not None and reference < name:
+                reference = next(references, None)
+            self.visit(
+                name, entry, reference != name and self.delete_image
+            )
+
+    def collect_thumbnails(self, start):
+        """Файлы миниатюр без записи в KV-хранилище: их исходное
+        изображение удалено или запись вытеснена."""
+        storage = default.storage
+        prefix = sorl_settings.THUMBNAIL_PREFIX
+        for chunk in batches(
+                walk_sorted(storage.location, prefix, start), BATCH_SIZE):
+            keys = {
+                name: add_prefix(ImageFile(name, storage).key)
+                for name, _ in chunk
+            }
+            known = fetch_kvstore(list(keys.values()))
+            for name, entry in chunk:
+                self.visit(
+                    name, entry,
+                    keys[name] not in known and self.delete_thumbnail
+                )
+
+    def visit(self, name, entry, delete):
+        """Удаляет ненужный файл функцией delete (False - файл нужен),
+        сохраняет позицию обхода и выдерживает --rate."""
+        if delete:
+            orphan_size = self.collect(name, entry, delete)
+            self.orphans += orphan_size is not None
+            self.size += orphan_size or 0
+        self.seen += 1
+        checkpoint = self.options['checkpoint']
+        if checkpoint and self.seen % CHECKPOINT_EVERY == 0:
+            self.save_checkpoint(checkpoint, name)
+        if self.options['rate']:
+            time.sleep(max(0, self.started + self.seen / self.options['rate']
+                           - time.monotonic()))
+
+    def collect(self, name, entry, delete):
+        """Удаляет ненужный файл. Возвращает его размер или None,
+        если файл слишком новый или уже снова нужен."""
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > self.deadline:
+            return None
+        if self.options['dry_run']:
+            self.stdout.write(name)
+            return stat.st_size
+        if not delete(name):
+            return None
+        if self.options['verbosity'] > 1:
+            self.stdout.write(name)
+        return stat.st_size
+
+    def delete_image(self, name):
+        """Удаляет изображение, если на него по-прежнему нет ссылок.
+        Проверка - под блокировкой строки StoredFile: загрузка того же
+        содержимого добавляет ссылку под той же блокировкой."""
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if (stored and stored.refs) or Post.objects.filter(
+                    image=name).exists():
+                return False
+            default.kvstore.delete(image_file(name))
+            StoredFile.objects.filter(name=name).delete()
+            # Без записи о ссылках хранилище удаляет файл сразу
+            self.storage.delete(name)
+        return True
+
+    def delete_thumbnail(self, name):
+        default.storage.delete(name)
+        return True
+
+    def load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return ''
+        with open(path) as checkpoint:
+            return json.load(checkpoint)['last']
+
+    def save_checkpoint(self, path, name):
+        with open(path + '.tmp', 'w') as checkpoint:
+            json.dump({'last': name}, checkpoint)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import export_stream
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии и подписки пользователя в NDJSON '
+        'потоком, не загружая их в память'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--output', default='-', help='Файл или - для stdout'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать на лету'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["username"]}')
+        output = options['output']
+        if output == '-':
+            self.write(user, sys.stdout.buffer, options['gzip'])
+            return
+        with open(output, 'wb') as file:
+            self.write(user, file, options['gzip'])
+
+    def write(self, user, file, compress):
+        for chunk in export_stream(user, compress):
+            file.write(chunk)
@@ -0,0 +1,349 @@
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, ImportedPost, Post, User
+from posts.timeline import batches
+from posts.versions import bump_feeds, bump_follow_feeds
+
+KINDS = {'posts': Post, 'comments': Comment, 'follows': Follow}
+# Выгрузка export_yatube: записи всех видов в одном файле, вид - в поле
+# type. Посты пачки загружаются раньше комментариев к ним
+EXPORT_KIND = 'export'
+TYPES = {'post': 'posts', 'comment': 'comments', 'follow': 'follows'}
+# Строк в одном INSERT: bulk_create дополнительно ограничивает пачку
+# числом параметров запроса SQLite
+BATCH_SIZE = 500
+# Строк в одной транзакции и между сохранениями позиции
+CHUNK_SIZE = 10000
+
+
+def open_records(path):
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, newline='')
+
+
+def read_records(path, file_format):
+    """Записи файла по одной: строки JSONL или CSV с заголовком.
+    Файл .gz читается со сжатием."""
+    with open_records(path) as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def split_by_type(records):
+    """Записи выгрузки по видам: [(вид, записи)] в порядке KINDS."""
+    kinds = {kind: [] for kind in KINDS}
+    for record in records:
+        kind = TYPES.get(record.get('type'))
+        if kind is None:
+            raise CommandError(f'Неизвестный type записи: {record}')
+        kinds[kind].append(record)
+    return [(kind, records) for kind, records in kinds.items() if records]
+
+
+def source_id(record):
+    """id поста в файле или None."""
+    return int(record['id']) if record.get('id') else None
+
+
+def chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_date(value):
+    """Дата из файла в том виде, в каком ее хранит база."""
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise CommandError(f'Неверная дата: {value}')
+    if settings.USE_TZ and timezone.is_naive(date):
+        return timezone.make_aware(date)
+    if not settings.USE_TZ and timezone.is_aware(date):
+        return timezone.make_naive(date)
+    return date
+
+
+@contextmanager
+def explicit_dates(model):
+    """Даты из файла не перезаписываются auto_now_add."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+@contextmanager
+def dropped_indexes(model, drop):
+    """Без индексов Meta.indexes на время загрузки: один CREATE INDEX
+    по готовой таблице быстрее миллионов вставок в B-дерево."""
+    if not drop:
+        yield
+        return
+    indexes = model._meta.indexes
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(model, index)
+
+
+class Lookup:
+    """Имя -> id, дочитываемое из базы для каждой пачки. Записи,
+    которых нет в базе, создаются, если задана create."""
+
+    def __init__(self, model, field, create=None, value='pk'):
+        self.model, self.field, self.create = model, field, create
+        self.value = value
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = {name for name in names if name} - self.ids.keys()
+        for batch in batches(missing):
+            self.load(batch)
+        new = missing - self.ids.keys()
+        if new and self.create:
+            self.model.objects.bulk_create(
+                [self.create(name) for name in new], ignore_conflicts=True
+            )
+            for batch in batches(new):
+                self.load(batch)
+        return self.ids
+
+    def load(self, names):
+        self.ids.update(self.model.objects.filter(
+            **{f'{self.field}__in': names}
+        ).values_list(self.field, self.value))
+
+
+def create_returning_pks(model, objects, batch_size):
+    """bulk_create, после которого у объектов есть pk. SQLite их
+    не возвращает, но строки, вставленные в одной транзакции, получают
+    подряд идущие id: это последние id таблицы."""
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        pks = model.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:len(objects)]
+        for obj, pk in zip(objects, reversed(pks)):
+            obj.pk = pk
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты, комментарии или подписки из JSONL или CSV '
+        'пачками bulk_create, затем пересчитывает счетчики и ленты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=[*KINDS, EXPORT_KIND],
+            help=f'{EXPORT_KIND} - файл export_yatube с записями всех видов'
+        )
+        parser.add_argument('path', help='Файл или - для stdin')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='По умолчанию - по расширению файла'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с числом загруженных строк: прерванная загрузка '
+                 'продолжится после них'
+        )
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help='Удалить вторичные индексы на время загрузки'
+        )
+        parser.add_argument(
+            '--no-finalize', action='store_true',
+            help='Не пересчитывать счетчики и ленты (при загрузке '
+                 'нескольких файлов подряд - до последнего)'
+        )
+
+    def handle(self, *args, **options):
+        kind, path = options['kind'], options['path']
+        file_format = options['format'] or (
+            'csv' if path.removesuffix('.gz').endswith('.csv') else 'jsonl'
+        )
+        self.users = Lookup(User, 'username', lambda username: User(
+            username=username, password=make_password(None)
+        ))
+        self.groups = Lookup(Group, 'slug', lambda slug: Group(
+            title=slug, slug=slug, description=''
+        ))
+        # id постов в файле не совпадают с id в базе
+        self.posts = Lookup(ImportedPost, 'source_id', value='post_id')
+        checkpoint = options['checkpoint']
+        done = self.load_checkpoint(checkpoint)
+        records = islice(read_records(path, file_format), done, None)
+        kinds = list(KINDS) if kind == EXPORT_KIND else [kind]
+        self.batch_size = options['batch_size']
+        loaded = 0
+        started = time.monotonic()
+        with ExitStack() as stack:
+            for name in kinds:
+                stack.enter_context(
+                    dropped_indexes(KINDS[name], options['drop_indexes'])
+                )
+                stack.enter_context(explicit_dates(KINDS[name]))
+            for chunk in chunked(records, options['chunk_size']):
+                with transaction.atomic():
+                    loaded += sum(
+                        self.load(name, chunk_records)
+                        for name, chunk_records in (
+                            split_by_type(chunk) if kind == EXPORT_KIND
+                            else [(kind, chunk)]
+                        )
+                    )
+                done += len(chunk)
+                if checkpoint:
+                    self.save_checkpoint(checkpoint, done)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Прочитано строк: {done}, загружено: {loaded}, '
+                    f'{loaded / elapsed:.0f} строк/с'
+                )
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if not options['no_finalize']:
+            self.finalize()
+
+    def load(self, kind, records):
+        """Загружает записи одного вида, возвращает число новых строк."""
+        if kind == 'posts':
+            return self.load_posts(records)
+        model = KINDS[kind]
+        objects = getattr(self, f'build_{kind}')(records)
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size,
+            ignore_conflicts=model is Follow
+        )
+        return len(objects)
+
+    def load_posts(self, records):
+        """Посты получают новые id, соответствие id из файла
+        запоминается в ImportedPost. Уже загруженные посты пропускаются."""
+        imported = self.posts.resolve(source_id(record) for record in records)
+        new, seen = [], set()
+        for record in records:
+            key = source_id(record)
+            if key not in imported and key not in seen:
+                new.append(record)
+            if key:
+                seen.add(key)
+        records = new
+        posts = self.build_posts(records)
+        create_returning_pks(Post, posts, self.batch_size)
+        links = [
+            ImportedPost(source_id=source_id(record), post_id=post.pk)
+            for record, post in zip(records, posts) if source_id(record)
+        ]
+        ImportedPost.objects.bulk_create(links, batch_size=self.batch_size)
+        imported.update((link.source_id, link.post_id) for link in links)
+        return len(posts)
+
+    def build_posts(self, records):
+        authors = self.users.resolve(record['author'] for record in records)
+        groups = self.groups.resolve(
+            record.get('group') for record in records
+        )
+        return [
+            Post(
+                text=record['text'],
+                author_id=authors[record['author']],
+                group_id=groups.get(record.get('group')),
+                pub_date=parse_date(record.get('pub_date'))
+            )
+            for record in records
+        ]
+
+    def build_comments(self, records):
+        authors = self.users.resolve(record['author'] for record in records)
+        post_ids = self.posts.resolve(
+            int(record['post']) for record in records
+        )
+        # Комментарии к постам, которых не было в загрузках, пропускаются
+        return [
+            Comment(
+                post_id=post_ids[int(record['post'])],
+                author_id=authors[record['author']],
+                text=record['text'],
+                created=parse_date(record.get('created'))
+            )
+            for record in records if int(record['post']) in post_ids
+        ]
+
+    def build_follows(self, records):
+        users = self.users.resolve(
+            name for record in records
+            for name in (record['user'], record['author'])
+        )
+        return [
+            Follow(
+                user_id=users[record['user']],
+                author_id=users[record['author']]
+            )
+            for record in records if record['user'] != record['author']
+        ]
+
+    def finalize(self):
+        """bulk_create не отправляет сигналы: счетчики, ленты подписок
+        и версии закэшированных страниц обновляются здесь."""
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        bump_feeds(group_slugs=self.groups.ids, usernames=self.users.ids)
+        bump_follow_feeds(
+            Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True
+            ).distinct().iterator()
+        )
+
+    def load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return json.load(checkpoint)['done']
+
+    def save_checkpoint(self, path, done):
+        with open(path + '.tmp', 'w') as checkpoint:
+            json.dump({'done': done}, checkpoint)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import rebuild_index, search_available
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс постов из таблицы постов'
+
+    def handle(self, *args, **options):
+        if not search_available():
+            raise CommandError('Полнотекстовый поиск требует SQLite с FTS5')
+        started = time.monotonic()
+        rebuild_index()
+        self.stdout.write(
+            f'Индекс построен за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Follow
+from posts.timeline import get_timeline
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает ленты подписок из таблицы Follow'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, чьи ленты нужно собрать (по умолчанию все)'
+        )
+
+    def handle(self, *args, **options):
+        timeline = get_timeline()
+        followers = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+        if options['usernames']:
+            followers = followers.filter(
+                user__username__in=options['usernames']
+            )
+        rebuilt = 0
+        for user_id in followers.iterator():
+            timeline.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Собрано лент: {rebuilt}')
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import reconcile_author_stats, reconcile_comments_count
+from posts.models import Post, User
+
+
+def pk_batches(query_set, size):
+    """id записей пачками по size, по возрастанию id."""
+    last = 0
+    while True:
+        ids = list(
+            query_set.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', flat=True
+            )[:size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счетчики постов, комментариев и подписок с базой '
+        'и исправляет расхождения пачками'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между пачками в секундах'
+        )
+
+    def handle(self, *args, **options):
+        for name, query_set, reconcile in (
+            ('пользователей', User.objects.all(), reconcile_author_stats),
+            ('постов', Post.objects.all(), reconcile_comments_count),
+        ):
+            checked = fixed = 0
+            for ids in pk_batches(query_set, options['batch_size']):
+                with transaction.atomic():
+                    fixed += reconcile(ids)
+                checked += len(ids)
+                time.sleep(options['pause'])
+            self.stdout.write(
+                f'Проверено {name}: {checked}, исправлено: {fixed}'
+            )
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import StoredFile
+from posts.models import Post
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит изображения постов, сохраненные до хранилища '
+        'с адресацией по содержимому, в подкаталоги по хэшу '
+        'и пересчитывает ссылки на файлы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        moved = {}
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk).exclude(image='')
+                .order_by('pk').values_list('pk', 'image')
+                [:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            with transaction.atomic():
+                for pk, name in batch:
+                    if storage.is_hashed(name):
+                        continue
+                    if name not in moved:
+                        moved[name] = self.move(storage, name)
+                    Post.objects.filter(pk=pk).update(image=moved[name])
+        refs = Counter(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+            .iterator()
+        )
+        with transaction.atomic():
+            for name, count in refs.items():
+                StoredFile.objects.update_or_create(
+                    name=name,
+                    defaults={'size': storage.size(name), 'refs': count}
+                )
+        self.stdout.write(
+            f'Перенесено файлов: {len(moved)}, всего файлов: {len(refs)}'
+        )
+
+    def move(self, storage, name):
+        with storage.open(name) as content:
+            new_name = storage.hashed_name(name, content)
+            if not storage.exists(new_name):
+                storage._save(new_name, content)
+        # Старый файл удаляется только после фиксации пачки: при откате
+        # посты продолжают ссылаться на него
+        transaction.on_commit(lambda: storage.delete(name))
+        return new_name
@@ -0,0 +1,105 @@
+"""Полнотекстовый поиск по постам в таблице SQLite FTS5.
+
+posts_post_fts - индекс с внешним содержимым (external content): тексты
+хранятся только в posts_post, а индекс обновляют триггеры на вставку,
+удаление и изменение текста поста (миграция 0010_post_search), так что
+его не обходят ни save(), ни update(), ни каскадные удаления. Результаты
+упорядочены по bm25 и листаются курсором (ранг, id), без OFFSET.
+Заново построить индекс: manage.py rebuild_search_index.
+"""
+import base64
+import binascii
+import re
+from functools import lru_cache
+
+from django.db import connection, connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# Слова запроса: все остальное (кавычки, операторы FTS5) отбрасывается
+WORD_RE = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+@lru_cache()
+def search_available():
+    """Индекс есть только в SQLite, собранной с FTS5."""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return ('ENABLE_FTS5',) in cursor.fetchall()
+
+
+def fts_query(text):
+    """Запрос FTS5 из пользовательского текста: все слова, каждое
+    в кавычках, чтобы не разбирались как операторы."""
+    return ' '.join(
+        f'"{term}"' for term in WORD_RE.findall(text)[:MAX_TERMS]
+    )
+
+
+def encode_rank_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rank_cursor(token):
+    """(ранг, id) или None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = raw.decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def search_posts(text, limit, after=None):
+    """Страница результатов поиска: (посты, курсор следующей страницы)."""
+    query = fts_query(text)
+    if not query:
+        return [], None
+    sql = f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    params = [query]
+    position = after and decode_rank_cursor(after)
+    if position:
+        rank, pk = position
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [rank, rank, pk]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    # Поиск и чтение постов - в одной базе, выбранной роутером: реплики
+    # могут расходиться с основной базой
+    alias = router.db_for_read(Post)
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, params + [limit + 1])
+        rows = cursor.fetchall()
+    posts = Post.objects.using(alias).select_related(
+        'author', 'group'
+    ).in_bulk([pk for pk, _ in rows[:limit]])
+    next_cursor = (
+        encode_rank_cursor(rows[limit - 1][1], rows[limit - 1][0])
+        if len(rows) > limit else None
+    )
+    return [posts[pk] for pk, _ in rows[:limit] if pk in posts], next_cursor
+
+
+def filter_matching(queryset, text):
+    """queryset, суженный до постов, которые находит индекс."""
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [fts_query(text)]
+    ))
+
+
+def rebuild_index():
+    """Заново строит индекс из posts_post одним проходом и сливает
+    его сегменты."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"
+        )
@@ -0,0 +1,210 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_versions
+
+from .counters import change_author_stats, change_comments_count
+from .models import Comment, Follow, Group, Post, User
+from .thumbnails import release_image, thumbnails_ready
+from .timeline import get_timeline
+from .versions import bump_feeds, bump_follow_feeds, bump_follower_feeds
+
+
+# Новый пост попадает в ленты подписчиков автора
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        get_timeline().push(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_timelines(sender, instance, **kwargs):
+    get_timeline().remove_post(instance)
+
+
+# Подписка добавляет в ленту последние посты автора
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        get_timeline().backfill(instance.user_id, instance.author_id)
+
+
+# Отписка убирает посты автора из ленты
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    get_timeline().remove_author(instance.user_id, instance.author_id)
+
+
+# Счетчики постов, комментариев и подписок
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        change_author_stats(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_author_stats(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        change_author_stats(instance.author_id, 'followers_count', 1)
+        change_author_stats(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_author_stats(instance.author_id, 'followers_count', -1)
+    change_author_stats(instance.user_id, 'following_count', -1)
+
+
+# Автор, опустившийся ниже порога популярности, снова раскладывается
+# по лентам подписчиков (после пересчета счетчика подписчиков)
+@receiver(post_delete, sender=Follow)
+def demote_celebrity(sender, instance, **kwargs):
+    get_timeline().unfollowed(instance.author_id)
+
+
+def bump_after_commit(bump):
+    """Меняет версии сразу и еще раз после фиксации транзакции: иначе
+    страница, собранная между ними из старых данных, останется в кэше
+    под новой версией."""
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+# Версии карточек постов: пост, его группа и имя автора
+@receiver(post_save, sender=Post)
+def bump_post_version(sender, instance, **kwargs):
+    name = f'post:{instance.pk}'
+    bump_after_commit(lambda: bump_versions(name))
+
+
+@receiver(post_save, sender=Group)
+def bump_group_version(sender, instance, **kwargs):
+    name = f'group:{instance.pk}'
+    bump_after_commit(lambda: bump_versions(name))
+
+
+@receiver(post_save, sender=User)
+def bump_user_version(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login
+    if update_fields and not {
+            'username', 'first_name', 'last_name'} & set(update_fields):
+        return
+    name, author_id = f'user:{instance.pk}', instance.pk
+    # Имя автора есть на всех страницах с его постами
+    group_slugs = set(instance.posts.exclude(group=None).values_list(
+        'group__slug', flat=True
+    ))
+    usernames, feed = [instance.username], instance.posts.exists()
+
+    def bump():
+        bump_versions(name)
+        bump_feeds(group_slugs=group_slugs, usernames=usernames, feed=feed)
+        bump_follower_feeds(author_id)
+
+    bump_after_commit(bump)
+
+
+# Страницы лент: главная, группа поста и профиль автора
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, **kwargs):
+    instance.previous_group_slug, instance.previous_image = (
+        instance.pk and Post.objects.filter(pk=instance.pk).values_list(
+            'group__slug', 'image'
+        ).first()
+    ) or (None, None)
+    # Новая загрузка добавит ссылку на файл, даже если его имя
+    # по содержимому совпадет с прежним
+    instance.image_uploaded = bool(
+        instance.image and not instance.image._committed
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_feeds(sender, instance, **kwargs):
+    group_slugs = {
+        instance.group and instance.group.slug,
+        getattr(instance, 'previous_group_slug', None)
+    }
+    usernames, author_id = [instance.author.username], instance.author_id
+
+    def bump():
+        bump_feeds(group_slugs=group_slugs, usernames=usernames)
+        bump_follower_feeds(author_id)
+
+    bump_after_commit(bump)
+
+
+# Страницы, собранные до готовности миниатюр, показывают исходное
+# изображение и не должны оставаться в кэше
+@receiver(thumbnails_ready)
+def bump_image_posts(sender, name, **kwargs):
+    posts = Post.objects.filter(image=name).values_list(
+        'pk', 'group__slug', 'author__username', 'author_id'
+    )
+    group_slugs, usernames, author_ids = set(), set(), set()
+    names = []
+    for pk, slug, username, author_id in posts:
+        names.append(f'post:{pk}')
+        group_slugs.add(slug)
+        usernames.add(username)
+        author_ids.add(author_id)
+    if not names:
+        return
+    bump_versions(*names)
+    bump_feeds(group_slugs=group_slugs, usernames=usernames)
+    for author_id in author_ids:
+        bump_follower_feeds(author_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_feeds(sender, instance, **kwargs):
+    slug = instance.slug
+    bump_after_commit(lambda: bump_feeds(group_slugs=[slug]))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_followed_feeds(sender, instance, **kwargs):
+    username, user_id = instance.author.username, instance.user_id
+
+    def bump():
+        bump_feeds(usernames=[username], feed=False)
+        bump_follow_feeds([user_id])
+
+    bump_after_commit(bump)
+
+
+# Ссылки на файлы изображений в хранилище с адресацией по содержимому
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_image', None)
+    if previous and (previous != instance.image.name
+                     or getattr(instance, 'image_uploaded', False)):
+        transaction.on_commit(lambda: release_image(previous))
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: release_image(name))
@@ -0,0 +1,37 @@
+from django import template
+
+from posts.thumbnails import (CONTENT_TYPES, FORMATS, WIDTHS,
+                              prefetch_thumbnails)
+
+register = template.Library()
+
+# Ширина изображения на странице: на всю ширину экрана до 960 пикселей
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post):
+    """Изображение поста с вариантами разной ширины в srcset.
+    Пока варианты не построены, выводится исходное изображение."""
+    if not post.image:
+        return {}
+    if not hasattr(post, 'variants'):
+        prefetch_thumbnails([post])
+    if not post.thumbnail_ready:
+        return {'src': post.image.url}
+    sources = [
+        {
+            'type': CONTENT_TYPES[image_format],
+            'srcset': ', '.join(
+                f'{post.variants[width, image_format].url} {width}w'
+                for width in WIDTHS
+            ),
+        }
+        for image_format in FORMATS
+    ]
+    return {
+        'src': post.variants[WIDTHS[-1], FORMATS[-1]].url,
+        'sources': sources[:-1],
+        'srcset': sources[-1]['srcset'],
+        'sizes': SIZES,
+    }
@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+CHANGELIST_NAMES = (
+    'admin:posts_post_changelist',
+    'admin:posts_comment_changelist',
+    'admin:posts_follow_changelist',
+)
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.groups = [
+            Group.objects.create(
+                title=f'группа {i}', slug=f'group_{i}', description='-'
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'user_{User.objects.count()}'
+            )
+            post = Post.objects.create(
+                text='текст', author=author, group=self.groups[i % 3]
+            )
+            Comment.objects.create(post=post, author=author, text='текст')
+            Follow.objects.create(user=author, author=self.admin)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка в админке не зависит от числа строк"""
+        for name in CHANGELIST_NAMES:
+            with self.subTest(name=name):
+                url = reverse(name)
+                self.add_rows(2)
+                few = self.count_queries(url)
+                self.add_rows(8)
+                self.assertEqual(self.count_queries(url), few)
+
+    def test_date_hierarchy(self):
+        """Список постов фильтруется по дате публикации"""
+        self.add_rows(1)
+        post = Post.objects.get()
+        response = self.client.get(reverse(CHANGELIST_NAMES[0]), {
+            'pub_date__year': post.pub_date.year
+        })
+        self.assertContains(response, f'>{post.pk}<')
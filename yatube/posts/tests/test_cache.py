@@ -0,0 +1,372 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from core.cache import (LOCK_TIME, cache_page_versioned,
+                        flush_page_cache_stats, get_page_cache_stats,
+                        get_version, page_cache_key, recompute_early)
+from core.cache_backends import SQLiteCache
+from posts.models import Comment, Follow, Group, Post, User
+from posts.versions import FOLLOW_FEED
+
+AUTHOR = 'author'
+GROUP_SLUG = 'group'
+
+INDEX_URL = reverse('posts:index')
+GROUP_LIST_URL = reverse('posts:group_list', kwargs={'slug': GROUP_SLUG})
+PROFILE_URL = reverse('posts:profile', kwargs={'username': AUTHOR})
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.group = Group.objects.create(
+            title='группа', slug=GROUP_SLUG, description='описание'
+        )
+        cls.post = Post.objects.create(
+            text='исходный текст', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def content(self):
+        return self.client.get(GROUP_LIST_URL).content.decode()
+
+    def test_card_cached_until_post_saved(self):
+        """Карточка берется из кэша, пока пост не сохранен заново"""
+        self.assertIn('исходный текст', self.content())
+        Post.objects.filter(pk=self.post.pk).update(text='тихая правка')
+        self.assertIn('исходный текст', self.content())
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'новый текст'
+        post.save()
+        self.assertIn('новый текст', self.content())
+
+    def test_card_refreshed_on_author_rename(self):
+        """Карточка обновляется при смене имени автора"""
+        self.assertNotIn('Новое Имя', self.content())
+        self.author.first_name, self.author.last_name = 'Новое', 'Имя'
+        self.author.save()
+        self.assertIn('Новое Имя', self.content())
+
+
+class FeedPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='группа', slug=GROUP_SLUG, description='описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='другая группа', slug='other', description='описание'
+        )
+        cls.post = Post.objects.create(
+            text='исходный текст', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def content(self, url):
+        return self.client.get(url).content.decode()
+
+    def test_pages_cached_until_post_saved(self):
+        """Страницы лент берутся из кэша до сохранения поста"""
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL]
+        for url in urls:
+            self.assertIn('исходный текст', self.content(url))
+        Post.objects.filter(pk=self.post.pk).update(text='тихая правка')
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIn('исходный текст', self.content(url))
+        Post.objects.create(text='новый пост', author=self.author,
+                            group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIn('новый пост', self.content(url))
+
+    def test_pages_bumped_again_after_commit(self):
+        """Страница, собранная до фиксации транзакции, не остается
+        в кэше под новой версией"""
+        callbacks = []
+        with mock.patch('posts.signals.transaction.on_commit',
+                        callbacks.append):
+            post = Post.objects.get(pk=self.post.pk)
+            post.text = 'новый текст'
+            post.save()
+        Post.objects.filter(pk=post.pk).update(text='исходный текст')
+        self.assertIn('исходный текст', self.content(INDEX_URL))
+        Post.objects.filter(pk=post.pk).update(text='новый текст')
+        for callback in callbacks:
+            callback()
+        self.assertIn('новый текст', self.content(INDEX_URL))
+
+    def test_group_change_refreshes_both_groups(self):
+        """Перенос поста в другую группу обновляет страницы обеих групп"""
+        other_url = reverse('posts:group_list', kwargs={'slug': 'other'})
+        self.assertIn('исходный текст', self.content(GROUP_LIST_URL))
+        self.assertNotIn('исходный текст', self.content(other_url))
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertNotIn('исходный текст', self.content(GROUP_LIST_URL))
+        self.assertIn('исходный текст', self.content(other_url))
+
+    def test_pages_vary_by_user(self):
+        """Закэшированная страница не показывается другому пользователю"""
+        self.assertIn('reader', self.content(INDEX_URL))
+        self.client.logout()
+        self.assertNotIn('reader', self.content(INDEX_URL))
+
+    def test_follow_refreshes_profile(self):
+        """Подписка сразу меняет кнопку на странице автора"""
+        self.assertIn('Подписаться', self.content(PROFILE_URL))
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertIn('Отписаться', self.content(PROFILE_URL))
+
+
+class FollowFeedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.other = User.objects.create_user(username='other')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text='пост автора', author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def content(self):
+        return self.client.get(FOLLOW_INDEX_URL).content.decode()
+
+    def test_followed_author_post_refreshes_feed(self):
+        """Пост автора из подписок сразу попадает в закэшированную ленту"""
+        self.assertIn('пост автора', self.content())
+        Post.objects.filter(pk=self.post.pk).update(text='тихая правка')
+        self.assertIn('пост автора', self.content())
+        Post.objects.create(text='новый пост', author=self.author)
+        self.assertIn('новый пост', self.content())
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=1)
+    def test_celebrity_post_not_fanned_out(self):
+        """Пост популярного автора не меняет версии лент подписчиков,
+        но обновляет их"""
+        self.assertIn('пост автора', self.content())
+        follow_feed = get_version(
+            FOLLOW_FEED.format(user_id=self.reader.pk)
+        )
+        Post.objects.create(text='новый пост', author=self.author)
+        self.assertEqual(
+            get_version(FOLLOW_FEED.format(user_id=self.reader.pk)),
+            follow_feed
+        )
+        self.assertIn('новый пост', self.content())
+
+    def test_other_authors_keep_feed_cached(self):
+        """Посты чужих авторов не сбрасывают ленту подписок"""
+        self.assertIn('пост автора', self.content())
+        Post.objects.filter(pk=self.post.pk).update(text='тихая правка')
+        Post.objects.create(text='чужой пост', author=self.other)
+        self.assertIn('пост автора', self.content())
+
+    def test_follow_refreshes_feed(self):
+        """Подписка и отписка сразу меняют ленту"""
+        Post.objects.create(text='чужой пост', author=self.other)
+        self.assertNotIn('чужой пост', self.content())
+        Follow.objects.create(user=self.reader, author=self.other)
+        self.assertIn('чужой пост', self.content())
+        Follow.objects.filter(user=self.reader, author=self.other).delete()
+        self.assertNotIn('чужой пост', self.content())
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.location = os.path.join(directory, 'cache.sqlite3')
+        self.cache = self.create_cache()
+
+    def create_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_shared_between_instances(self):
+        """Запись видна другому экземпляру с тем же файлом"""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.create_cache().get('key'), {'value': 1})
+        self.assertEqual(
+            self.create_cache().get_many(['key', 'missing']),
+            {'key': {'value': 1}}
+        )
+
+    def test_add_and_expiration(self):
+        """add не перезаписывает живую запись, истекшая не читается"""
+        self.assertTrue(self.cache.add('lock', 1, 60))
+        self.assertFalse(self.create_cache().add('lock', 2, 60))
+        self.cache.set('old', 1, 60)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get('old'))
+            self.assertTrue(self.cache.add('lock', 3, 60))
+        self.assertEqual(self.cache.get('lock'), 3)
+
+    def test_least_recently_used_evicted(self):
+        """При переполнении вытесняются давно не читавшиеся записи"""
+        cache = self.create_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            cache.set_many({f'key{i}': i for i in range(11)})
+        with mock.patch('time.time', return_value=now + 10):
+            cache.get('key0')
+            cache.cull()
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        stats = cache.get_stats()
+        self.assertEqual(stats['entries'], 5)
+        self.assertEqual(stats['evictions'], 6)
+
+
+class StampedeProtectionTest(TestCase):
+    def setUp(self):
+        # Счетчики других тестов не должны попасть в проверки
+        flush_page_cache_stats()
+        cache.clear()
+        self.calls = 0
+
+        @cache_page_versioned(60)
+        def view(request):
+            self.calls += 1
+            return HttpResponse(f'версия {self.calls}')
+
+        self.view = view
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+
+    def get(self):
+        response = self.view(self.request)
+        return response.content.decode(), response['X-Cache']
+
+    def lock_page(self):
+        key = page_cache_key(self.view, self.request, [])
+        cache.add(key + ':lock', 1, LOCK_TIME)
+
+    def test_stale_page_served_while_locked(self):
+        """Пока страницу пересчитывает другой запрос, отдается
+        устаревшая копия"""
+        self.assertEqual(self.get(), ('версия 1', 'MISS'))
+        self.assertEqual(self.get(), ('версия 1', 'HIT'))
+        expired = time.time() + 61
+        with mock.patch('time.time', return_value=expired):
+            self.lock_page()
+            self.assertEqual(self.get(), ('версия 1', 'STALE'))
+        cache.delete(page_cache_key(self.view, self.request, []) + ':lock')
+        with mock.patch('time.time', return_value=expired):
+            self.assertEqual(self.get(), ('версия 2', 'EXPIRED'))
+        self.assertEqual(self.calls, 2)
+
+    def test_waits_for_page_built_elsewhere(self):
+        """При промахе и чужой блокировке страница не строится дважды"""
+        self.lock_page()
+        with mock.patch('core.cache.LOCK_WAIT', 0):
+            self.assertEqual(self.get(), ('версия 1', 'MISS'))
+        self.assertEqual(self.get(), ('версия 1', 'HIT'))
+
+    def test_early_recomputation(self):
+        """XFetch пересчитывает страницу до истечения"""
+        self.get()
+        with mock.patch('core.cache.recompute_early', return_value=True):
+            self.assertEqual(self.get(), ('версия 2', 'EARLY'))
+        self.assertEqual(self.get(), ('версия 2', 'HIT'))
+
+    def test_early_recomputation_probability(self):
+        """Вероятность раннего пересчета растет к истечению
+        и с временем построения страницы"""
+        with mock.patch('random.random', return_value=0.5):
+            # -ln(0.5) ~ 0.69 времени построения до истечения
+            self.assertFalse(recompute_early(100, 1, 99))
+            self.assertTrue(recompute_early(100, 1, 99.5))
+            self.assertTrue(recompute_early(100, 10, 95))
+
+    def test_stats(self):
+        """Счетчики попаданий общие и видны через get_page_cache_stats"""
+        self.get()
+        self.get()
+        self.assertEqual(
+            get_page_cache_stats(), {'miss': 1, 'hit': 1}
+        )
+
+
+class ConditionalResponseTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.post = Post.objects.create(text='текст', author=cls.author)
+        cls.post_url = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.pk}
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        cache.clear()
+
+    def assertNotModified(self, url, modified):
+        """Повторный запрос с валидаторами получает 304 до изменения
+        и 200 после него"""
+        # Первый ответ может выставить CSRF-cookie, от которой зависит ETag
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        modified()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_feed_pages(self):
+        """Страницы лент отвечают 304 до нового поста"""
+        for url in (INDEX_URL, PROFILE_URL):
+            with self.subTest(url=url):
+                self.assertNotModified(url, lambda: Post.objects.create(
+                    text='новый пост', author=self.author
+                ))
+
+    def test_change_in_same_second(self):
+        """Изменение в ту же секунду не дает 304 по If-Modified-Since"""
+        response = self.client.get(INDEX_URL)
+        self.assertFalse(response.has_header('Last-Modified'))
+        Post.objects.create(text='новый пост', author=self.author)
+        self.assertEqual(
+            self.client.get(
+                INDEX_URL, HTTP_IF_MODIFIED_SINCE=http_date()
+            ).status_code,
+            200
+        )
+
+    def test_post_detail(self):
+        """Страница поста отвечает 304 до нового комментария"""
+        self.assertNotModified(self.post_url, lambda: Comment.objects.create(
+            post=self.post, author=self.author, text='комментарий'
+        ))
@@ -0,0 +1,92 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.counters import get_author_stats
+from posts.models import AuthorStats, Comment, Post, User
+
+AUTHOR = 'author'
+READER = 'reader'
+
+CREATE_URL = reverse('posts:post_create')
+PROFILE_URL = reverse('posts:profile', kwargs={'username': AUTHOR})
+FOLLOW_URL = reverse('posts:profile_follow', kwargs={'username': AUTHOR})
+UNFOLLOW_URL = reverse('posts:profile_unfollow', kwargs={'username': AUTHOR})
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.reader = User.objects.create_user(username=READER)
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Счетчики постов и комментариев меняются при записи и удалении"""
+        self.author_client.post(CREATE_URL, data={'text': 'пост'})
+        post = Post.objects.get()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            data={'text': 'комментарий'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            self.author_client.get(PROFILE_URL).context['stats'].posts_count,
+            1
+        )
+        Post.objects.all().delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_follow_counters(self):
+        """Счетчики подписчиков и подписок меняются при (от)писке"""
+        self.reader_client.get(FOLLOW_URL)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.reader_client.get(UNFOLLOW_URL)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_counters(self):
+        """reconcile_counters исправляет расхождения счетчиков"""
+        post = Post.objects.create(text='пост', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='текст')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=7)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_stats_read_without_count(self):
+        """Страницы автора и поста читают строку счетчиков без COUNT(*)"""
+        post = Post.objects.create(text='пост', author=self.author)
+        with self.assertNumQueries(1):
+            get_author_stats(self.author)
+        for url in (PROFILE_URL, reverse('posts:post_detail',
+                                         kwargs={'post_id': post.pk})):
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    Client().get(url)
+                self.assertFalse([
+                    query['sql'] for query in queries
+                    if 'COUNT(' in query['sql']
+                ])
@@ -0,0 +1,123 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core import db_router
+from core.db_router import (PIN_COOKIE, PRIMARY, PinPrimaryMiddleware,
+                            ReplicaRouter, mark_writes, use_replica)
+from posts.models import Post, User
+
+CREATE_URL = reverse('posts:post_create')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, view=None):
+        """База для чтения постов и пользователей внутри view."""
+        def read(request):
+            return HttpResponse(' '.join((
+                self.router.db_for_read(Post),
+                self.router.db_for_read(User)
+            )))
+        middleware = PinPrimaryMiddleware(view or use_replica(read))
+        return middleware(request)
+
+    def test_replica_views_read_from_replica(self):
+        """Отмеченные представления читают посты с реплики,
+        пользователей - из основной базы"""
+        response = self.route(self.factory.get('/'))
+        self.assertEqual(response.content.decode(), 'replica default')
+        self.assertEqual(self.router.db_for_read(Post), PRIMARY)
+
+    def test_writes_pin_primary(self):
+        """После записи ставится cookie, с которой чтение идет
+        из основной базы"""
+        def write(request):
+            mark_writes(
+                lambda *args: None, 'UPDATE posts_post SET text = %s',
+                ['текст'], False, {}
+            )
+            return HttpResponse()
+        response = self.route(self.factory.post('/'), write)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(
+            self.route(request).content.decode(), 'default default'
+        )
+        self.assertNotIn(PIN_COOKIE, self.route(request).cookies)
+
+
+class PinPrimaryTest(TestCase):
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_post_create_pins_primary(self):
+        """Новый пост закрепляет автора за основной базой"""
+        client = Client()
+        client.force_login(User.objects.create_user(username='author'))
+        response = client.post(CREATE_URL, {'text': 'пост'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_transaction_reads_primary(self):
+        """Внутри транзакции чтение идет из основной базы"""
+        self.assertEqual(
+            use_replica(lambda request: ReplicaRouter().db_for_read(Post))(
+                None
+            ),
+            PRIMARY
+        )
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_do_not_pin_primary(self):
+        """Чтение страниц гостем не ставит cookie основной базы"""
+        post = Post.objects.create(
+            text='пост', author=User.objects.create_user(username='author')
+        )
+        cache.clear()
+        for url in (
+                reverse('posts:index'),
+                reverse('posts:profile', kwargs={'username': 'author'}),
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})):
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_cached_feeds_read_primary(self):
+        """Страницы лент для кэша собираются из основной базы,
+        поиск читает с реплики"""
+        def replica_flags(url):
+            flags = []
+            with mock.patch.object(
+                    ReplicaRouter, 'db_for_read', autospec=True,
+                    side_effect=lambda router, model, **hints: flags.append(
+                        getattr(db_router._state, 'use_replica', False)
+                    )):
+                self.assertEqual(Client().get(url).status_code, 200)
+            return flags
+
+        cache.clear()
+        Post.objects.create(
+            text='пост', author=User.objects.create_user(username='author')
+        )
+        flags = replica_flags(reverse('posts:index'))
+        self.assertTrue(flags)
+        self.assertFalse(any(flags))
+        self.assertTrue(
+            any(replica_flags(reverse('posts:search') + '?q=пост'))
+        )
+
+    def test_without_replicas(self):
+        """Без реплик все читается из основной базы и cookie не ставится"""
+        response = Client().get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(ReplicaRouter().db_for_read(Post), PRIMARY)
@@ -0,0 +1,109 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+EXPORT_URL = reverse('posts:export_data')
+
+
+def parse(content):
+    return [json.loads(line) for line in content.decode().splitlines()]
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.other = User.objects.create_user(username='other')
+        group = Group.objects.create(
+            title='Коты', slug='cats', description='-'
+        )
+        cls.posts = [
+            Post.objects.create(text=f'пост {i}', author=cls.user,
+                                group=group if i == 0 else None)
+            for i in range(3)
+        ]
+        Post.objects.create(text='чужой пост', author=cls.other)
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.user, text='свой комментарий'
+        )
+        Follow.objects.create(user=cls.user, author=cls.other)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_export_streams_user_data(self):
+        """Выгрузка потоком содержит только записи пользователя"""
+        response = self.client.get(EXPORT_URL)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        records = parse(b''.join(response.streaming_content))
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['post'] * 3 + ['comment', 'follow']
+        )
+        self.assertEqual(
+            [record['id'] for record in records[:3]],
+            [post.pk for post in self.posts]
+        )
+        self.assertEqual(records[0]['group'], 'cats')
+        self.assertEqual(records[3]['text'], 'свой комментарий')
+        self.assertEqual(records[4]['author'], 'other')
+
+    def test_gzip(self):
+        """С compress=gzip выгрузка сжимается на лету"""
+        with mock.patch('posts.export.BUFFER_SIZE', 1):
+            response = self.client.get(EXPORT_URL, {'compress': 'gzip'})
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(len(parse(gzip.decompress(content))), 5)
+
+    def test_login_required(self):
+        """Гость перенаправляется на вход"""
+        response = Client().get(EXPORT_URL)
+        self.assertEqual(response.status_code, 302)
+
+    def test_command(self):
+        """Команда пишет ту же выгрузку в файл"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson.gz')
+            call_command(
+                'export_yatube', 'writer', '--output', path, '--gzip',
+                stdout=StringIO()
+            )
+            with gzip.open(path) as file:
+                self.assertEqual(len(parse(file.read())), 5)
+
+    def user_data(self):
+        return (
+            list(Post.objects.filter(author=self.user).order_by('pk')
+                 .values_list('text', 'group__slug', 'pub_date')),
+            list(Comment.objects.filter(author=self.user)
+                 .values_list('post__text', 'text', 'created')),
+            list(Follow.objects.filter(user=self.user)
+                 .values_list('author__username', flat=True)),
+        )
+
+    def test_round_trip(self):
+        """Выгрузка загружается обратно командой import_yatube"""
+        expected = self.user_data()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson.gz')
+            call_command(
+                'export_yatube', 'writer', '--output', path, '--gzip',
+                stdout=StringIO()
+            )
+            Post.objects.filter(author=self.user).delete()
+            Follow.objects.filter(user=self.user).delete()
+            call_command('import_yatube', 'export', path, stdout=StringIO())
+        self.assertEqual(self.user_data(), expected)
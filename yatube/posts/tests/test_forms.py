@@ -1,11 +1,18 @@
+import hashlib
+import io
 import shutil
 import tempfile
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from PIL.JpegImagePlugin import JpegImageFile
 
+from posts.forms import PostForm
+from posts.images import MAX_SIDE
 from posts.models import Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -24,6 +31,11 @@ SMALL_GIF = (
     b'\x02\x00\x01\x00\x00\x02\x02\x0C'
     b'\x0A\x00\x3B'
 )
+SMALL_GIF_HASH = hashlib.sha256(SMALL_GIF).hexdigest()
+# Имя файла в хранилище определяется содержимым, а не именем загрузки
+SMALL_GIF_NAME = (
+    f'posts/{SMALL_GIF_HASH[:2]}/{SMALL_GIF_HASH[2:4]}/{SMALL_GIF_HASH}.gif'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -76,7 +88,7 @@ class PostsFormTest(TestCase):
             post.group.id, form_data['group'],
             'поле "group" в базе не равно значению, отправленному в форме'
         )
-        self.assertEqual(post.image, 'posts/small.gif')
+        self.assertEqual(post.image, SMALL_GIF_NAME)
 
     def test_post_edit(self):
         """При отправке валидной формы изменяется запись в Post"""
@@ -109,7 +121,7 @@ class PostsFormTest(TestCase):
             post.author, self.post.author,
             'после отправки формы изменилось значение author'
         )
-        self.assertEqual(post.image, 'posts/new.gif')
+        self.assertEqual(post.image, SMALL_GIF_NAME)
 
     def test_post_add_comments(self):
         """При отправке формы авторизованным пользователем cоздается коммент"""
@@ -126,3 +138,62 @@ class PostsFormTest(TestCase):
             comments_count + 1, self.post.comments.count(),
             'неавторизованный пользователь не может добавлять комментарии'
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageIngestTest(TestCase):
+    def upload(self, size, image_format='JPEG', name='photo.jpg'):
+        output = io.BytesIO()
+        Image.new('RGB', size, 'red').save(output, image_format)
+        return SimpleUploadedFile(name, output.getvalue(), 'image/jpeg')
+
+    def form(self, image):
+        return PostForm(data={'text': 'текст'}, files={'image': image})
+
+    def test_large_photo_downscaled(self):
+        """Слишком большой снимок уменьшается до MAX_SIDE"""
+        form = self.form(self.upload((MAX_SIDE * 2, MAX_SIDE)))
+        self.assertTrue(form.is_valid(), form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (MAX_SIDE, MAX_SIDE // 2))
+
+    def test_mpo_photo_downscaled_as_jpeg(self):
+        """Снимок MPO уменьшается через draft и сохраняется как JPEG"""
+        # Pillow не записывает MPO: JPEG притворяется снимком с двумя кадрами
+        with mock.patch.object(JpegImageFile, 'format', 'MPO'), \
+                mock.patch.object(JpegImageFile, 'n_frames', 2,
+                                  create=True), \
+                mock.patch.object(JpegImageFile, 'is_animated', True,
+                                  create=True), \
+                mock.patch.object(JpegImageFile, 'draft',
+                                  autospec=True,
+                                  side_effect=JpegImageFile.draft) as draft:
+            form = self.form(self.upload((MAX_SIDE * 2, MAX_SIDE)))
+            self.assertTrue(form.is_valid(), form.errors)
+        draft.assert_called_once()
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (MAX_SIDE, MAX_SIDE // 2))
+
+    def test_small_photo_untouched(self):
+        """Небольшой снимок сохраняется как есть"""
+        upload = self.upload((100, 50))
+        form = self.form(upload)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data['image'], upload)
+
+    def test_pixel_limit_checked_before_decoding(self):
+        """Лимит пикселей проверяется по заголовку, без декодирования"""
+        with mock.patch('posts.images.MAX_PIXELS', 100 * 100 - 1), \
+                mock.patch('PIL.ImageFile.ImageFile.load') as load:
+            form = self.form(self.upload((100, 100)))
+            self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+        load.assert_not_called()
+
+    def test_png_decode_limit(self):
+        """Большой PNG без масштабирования при декодировании отклоняется"""
+        with mock.patch('posts.images.MAX_DECODE_PIXELS', 100), \
+                mock.patch('posts.images.MAX_SIDE', 5):
+            form = self.form(self.upload((20, 20), 'PNG', 'big.png'))
+            self.assertFalse(form.is_valid())
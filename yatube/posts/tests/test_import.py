@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from posts.models import (AuthorStats, Comment, Follow, Post, TimelineEntry,
+                          User)
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+POSTS = [
+    {'id': 10, 'text': 'первый', 'author': 'writer', 'group': 'cats',
+     'pub_date': '2020-01-02T03:04:05'},
+    {'id': 11, 'text': 'второй', 'author': 'writer'},
+    {'id': 12, 'text': 'третий', 'author': 'other', 'group': 'cats'},
+]
+
+
+def write_file(name, content):
+    path = os.path.join(TEMP_DIR, name)
+    with open(path, 'w') as file:
+        file.write(content)
+    return path
+
+
+def jsonl(records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def import_file(kind, path, *args):
+    call_command('import_yatube', kind, path, *args, stdout=StringIO())
+
+
+class ImportTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def test_import_posts(self):
+        """Посты загружаются с авторами, группами и датами из файла"""
+        import_file('posts', write_file('posts.jsonl', jsonl(POSTS)))
+        post = Post.objects.select_related('author', 'group').get(
+            text='первый'
+        )
+        self.assertEqual(
+            (post.text, post.author.username, post.group.slug,
+             post.pub_date),
+            ('первый', 'writer', 'cats', datetime(2020, 1, 2, 3, 4, 5))
+        )
+        self.assertIsNone(Post.objects.get(text='второй').group)
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(
+            AuthorStats.objects.get(user=post.author).posts_count, 2
+        )
+
+    def test_import_comments_and_follows(self):
+        """Комментарии и подписки загружаются из CSV, ссылки на
+        несуществующие посты и повторы пропускаются"""
+        import_file(
+            'posts', write_file('posts.jsonl', jsonl(POSTS)),
+            '--batch-size', '1'
+        )
+        import_file('comments', write_file(
+            'comments.csv',
+            'post,author,text,created\n'
+            '10,reader,отлично,2020-01-03 00:00:00\n'
+            '999,reader,потерялся,\n'
+        ))
+        import_file('follows', write_file(
+            'follows.csv',
+            'user,author\nreader,writer\nreader,writer\nreader,reader\n'
+        ))
+        self.assertEqual(Comment.objects.get().post.text, 'первый')
+        self.assertEqual(
+            Post.objects.get(text='первый').comments_count, 1
+        )
+        follow = Follow.objects.get()
+        self.assertEqual(
+            (follow.user.username, follow.author.username),
+            ('reader', 'writer')
+        )
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=follow.user).values_list(
+                'post__text', flat=True
+            )),
+            {'первый', 'второй'}
+        )
+
+    def test_resume_from_checkpoint(self):
+        """Загрузка продолжается после строк, указанных в --checkpoint"""
+        checkpoint = write_file('checkpoint.json', json.dumps({'done': 2}))
+        import_file(
+            'posts', write_file('posts.jsonl', jsonl(POSTS)),
+            '--checkpoint', checkpoint, '--chunk-size', '1'
+        )
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['третий']
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_ids_mapped_to_new_posts(self):
+        """id из файла не занимают id в базе: посты получают новые id,
+        комментарии находят их по id из файла, повторная загрузка
+        не дублирует посты"""
+        taken = Post.objects.create(
+            text='свой', author=User.objects.create_user(username='own')
+        )
+        path = write_file('posts.jsonl', jsonl([
+            {'id': taken.pk, 'text': 'чужой', 'author': 'writer'}
+        ]))
+        import_file('posts', path)
+        import_file('posts', path)
+        import_file('comments', write_file('comments.jsonl', jsonl([
+            {'post': taken.pk, 'author': 'reader', 'text': 'комментарий'}
+        ])))
+        imported = Post.objects.get(text='чужой')
+        self.assertNotEqual(imported.pk, taken.pk)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.get().post, imported)
+
+
+class DropIndexesTest(TransactionTestCase):
+    def tearDown(self):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def test_indexes_restored(self):
+        """Удаленные на время загрузки индексы создаются заново"""
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        import_file(
+            'posts', write_file('posts.jsonl', jsonl(POSTS)),
+            '--drop-indexes', '--no-finalize'
+        )
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            )
+        for index in Post._meta.indexes:
+            self.assertIn(index.name, constraints)
+        self.assertEqual(Post.objects.count(), len(POSTS))
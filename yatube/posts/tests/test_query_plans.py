@@ -0,0 +1,109 @@
+from django.test import TestCase
+
+from core.utils import CURSOR_FIELDS
+from posts.management.commands.collect_orphan_media import names_after
+from posts.models import Comment, Follow, Group, Post, User
+from posts.timeline import DBTimeline
+
+POSTS_ON_PAGE = 10
+
+
+def plan_problems(query_set):
+    """Строки плана запроса с полным просмотром таблицы
+    или сортировкой во временном B-дереве."""
+    problems = []
+    for line in query_set.explain().splitlines():
+        if 'USE TEMP B-TREE' in line:
+            problems.append(line)
+        elif ' SCAN ' in f' {line} ' and 'INDEX' not in line:
+            problems.append(line)
+    return problems
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='группа', slug='group', description='описание'
+        )
+        cls.post = Post.objects.create(
+            text='текст', author=cls.author, group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def assertIndexed(self, query_set):
+        self.assertEqual(
+            plan_problems(query_set), [], query_set.explain()
+        )
+
+    def feeds(self):
+        """Выборки лент так, как их строят представления"""
+        return {
+            'index': Post.objects.select_related('group', 'author').all(),
+            'group_posts': self.group.posts.select_related('author').all(),
+            'profile': self.author.posts.select_related('group').all(),
+            'follow_index': DBTimeline().pushed_posts(self.reader),
+        }
+
+    def test_feed_pages_use_indexes(self):
+        """Страницы лент читаются по индексу без сортировки"""
+        for name, query_set in self.feeds().items():
+            with self.subTest(view=name):
+                self.assertIndexed(query_set[:POSTS_ON_PAGE + 1])
+                self.assertIndexed(
+                    query_set[POSTS_ON_PAGE:POSTS_ON_PAGE * 2 + 1]
+                )
+
+    def test_cursor_pages_use_indexes(self):
+        """Курсорные страницы лент читаются по индексу без сортировки"""
+        for name, query_set in self.feeds().items():
+            field, tiebreak = (
+                DBTimeline.cursor_fields if name == 'follow_index'
+                else CURSOR_FIELDS
+            )
+            with self.subTest(view=name):
+                self.assertIndexed(
+                    query_set.filter(**{
+                        f'{field}__lt': self.post.pub_date
+                    }).order_by(f'-{field}', f'-{tiebreak}')[
+                        :POSTS_ON_PAGE + 1
+                    ]
+                )
+                self.assertIndexed(
+                    query_set.filter(**{
+                        f'{field}__gt': self.post.pub_date
+                    }).order_by(field, tiebreak)[:POSTS_ON_PAGE + 1]
+                )
+
+    def test_feed_counts_use_indexes(self):
+        """Число записей лент считается по индексу"""
+        for name, query_set in self.feeds().items():
+            if name == 'index':
+                continue
+            with self.subTest(view=name):
+                self.assertIndexed(query_set.order_by().values('pk'))
+
+    def test_post_detail_queries_use_indexes(self):
+        """Комментарии, посты автора и подписка читаются по индексу"""
+        query_sets = {
+            'comments': self.post.comments.select_related('author').all(),
+            'author_posts': self.post.author.posts.order_by().values('pk'),
+            'following': self.author.following.filter(user=self.reader),
+            'follower_ids': Follow.objects.filter(
+                author=self.author
+            ).values_list('user_id', flat=True),
+        }
+        for name, query_set in query_sets.items():
+            with self.subTest(query=name):
+                self.assertIndexed(query_set)
+
+    def test_orphan_media_names_use_index(self):
+        """Имена изображений для collect_orphan_media читаются по индексу"""
+        self.assertIndexed(names_after('posts/', ''))
+        self.assertIndexed(names_after('posts/', 'posts/ab/cd'))
@@ -0,0 +1,97 @@
+import io
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.models import Post, User
+from posts.search import FTS_TABLE, search_posts
+
+SEARCH_URL = reverse('posts:search')
+
+
+class PostSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.cat = Post.objects.create(
+            text='Кот спит на диване', author=cls.author
+        )
+        cls.cats = Post.objects.create(
+            text='кот и ещё один кот', author=cls.author
+        )
+        cls.dog = Post.objects.create(text='Собака гуляет', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, text, limit=10, after=None):
+        posts, next_cursor = search_posts(text, limit, after)
+        return [post.pk for post in posts], next_cursor
+
+    def test_ranked_results(self):
+        """Находятся все посты со словом, чаще упомянувшие - выше"""
+        self.assertEqual(
+            self.found('КОТ'), ([self.cats.pk, self.cat.pk], None)
+        )
+        self.assertEqual(self.found('кот собака'), ([], None))
+        self.assertEqual(self.found('" OR *'), ([], None))
+
+    def test_search_uses_read_database(self):
+        """Запрос к индексу идет в базу, выбранную роутером для чтения"""
+        with mock.patch('posts.search.router.db_for_read',
+                        return_value='default') as db_for_read, \
+                mock.patch('posts.search.connections') as connections:
+            connections.__getitem__.return_value = connection
+            self.assertEqual(self.found('кот')[0], [self.cats.pk, self.cat.pk])
+        db_for_read.assert_called_with(Post)
+        connections.__getitem__.assert_called_with('default')
+
+    def test_cursor_pagination(self):
+        """Курсор продолжает выдачу со следующего результата"""
+        first, cursor = self.found('кот', limit=1)
+        self.assertEqual(first, [self.cats.pk])
+        self.assertEqual(self.found('кот', 1, cursor), ([self.cat.pk], None))
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении постов"""
+        Post.objects.filter(pk=self.dog.pk).update(text='Кот гуляет')
+        self.assertIn(self.dog.pk, self.found('кот')[0])
+        self.assertEqual(self.found('собака'), ([], None))
+        Post.objects.filter(pk=self.cat.pk).delete()
+        self.assertNotIn(self.cat.pk, self.found('диване')[0])
+
+    def test_rebuild_command(self):
+        """Команда заново строит индекс из таблицы постов"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"
+            )
+        self.assertEqual(self.found('кот'), ([], None))
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(self.found('кот')[0]), 2)
+
+    def test_search_page(self):
+        """Страница поиска выводит найденные посты"""
+        response = self.client.get(SEARCH_URL, {'q': 'собака'})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(response.context['posts'], [self.dog])
+        self.assertEqual(
+            self.client.get(SEARCH_URL).context['posts'], []
+        )
+
+    def test_admin_search(self):
+        """Поиск в админке идет по индексу"""
+        admin = site._registry[Post]
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, use_distinct = admin.get_search_results(
+            request, Post.objects.all(), 'спит'
+        )
+        self.assertEqual(list(queryset), [self.cat])
+        self.assertFalse(use_distinct)
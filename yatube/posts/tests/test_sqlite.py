@@ -0,0 +1,38 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+
+class SQLitePragmasTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        """Соединение Django получает PRAGMA из SQLITE_PRAGMAS"""
+        self.assertEqual(
+            self.pragma('busy_timeout'),
+            settings.SQLITE_PRAGMAS['busy_timeout']
+        )
+        self.assertEqual(
+            self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size']
+        )
+        # 2 - MEMORY
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+    def test_bench_sqlite(self):
+        """Бенчмарк выводит строку для каждого профиля"""
+        output = StringIO()
+        call_command(
+            'bench_sqlite', '--duration', '0.1', '--rows', '100',
+            '--readers', '1', '--writers', '1', stdout=output
+        )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            [line.split()[0] for line in lines[1:]],
+            ['default', 'pragmas', 'persistent']
+        )
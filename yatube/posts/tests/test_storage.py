@@ -0,0 +1,306 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.models import StoredFile
+from core.views import serve_media
+from posts.models import Post, User
+from posts.thumbnails import VARIANTS, generate_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF[:-3] + b'\x0B\x00\x3B'
+
+
+def run_on_commit(func):
+    func()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@mock.patch('posts.signals.transaction.on_commit', run_on_commit)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.storage = Post._meta.get_field('image').storage
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name='small.gif', content=SMALL_GIF):
+        return Post.objects.create(
+            text='Текст', author=self.author, image=SimpleUploadedFile(
+                name=name, content=content, content_type='image/gif'
+            )
+        )
+
+    def refs(self, name):
+        return StoredFile.objects.get(name=name).refs
+
+    def test_same_content_stored_once(self):
+        """Одинаковые загрузки хранятся одним файлом с двумя ссылками"""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(self.storage.is_hashed(name))
+        self.assertTrue(name.startswith('posts/'))
+        self.assertEqual(self.refs(name), 2)
+        self.assertEqual(
+            len(self.storage.listdir(name.rsplit('/', 1)[0])[1]), 1
+        )
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется вместе с последним постом, который на него
+        ссылается"""
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+        second.delete()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_replaced_image_released(self):
+        """Замена изображения поста снимает ссылку на прежний файл"""
+        post = self.create_post()
+        name = post.image.name
+        post.image = SimpleUploadedFile(
+            name='other.gif', content=OTHER_GIF, content_type='image/gif'
+        )
+        post.save()
+        self.assertNotEqual(post.image.name, name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.refs(post.image.name), 1)
+
+    def test_same_image_reuploaded(self):
+        """Повторная загрузка того же изображения в пост не добавляет
+        лишнюю ссылку"""
+        post = self.create_post()
+        name = post.image.name
+        post.image = SimpleUploadedFile(
+            name='again.gif', content=SMALL_GIF, content_type='image/gif'
+        )
+        post.save()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(self.refs(name), 1)
+        post.delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_legacy_file_deleted(self):
+        """Файл без записи о ссылках удаляется сразу"""
+        name = self.storage._save(
+            'posts/legacy.gif', SimpleUploadedFile('legacy.gif', SMALL_GIF)
+        )
+        self.assertFalse(self.storage.is_hashed(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_shard_deletes_old_file_after_commit(self):
+        """shard_post_images удаляет прежний файл только после фиксации"""
+        name = self.storage._save(
+            'posts/sharded.gif', SimpleUploadedFile('sharded.gif', SMALL_GIF)
+        )
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   image=name)
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', callbacks.append):
+            call_command('shard_post_images', stdout=io.StringIO())
+        self.assertTrue(self.storage.exists(name))
+        post.refresh_from_db()
+        self.assertTrue(self.storage.is_hashed(post.image.name))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(post.image.name))
+
+    def test_save_after_last_reference_released(self):
+        """Загрузка содержимого, чья последняя ссылка снята, пишет файл
+        заново"""
+        post = self.create_post()
+        name = post.image.name
+        post.delete()
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.create_post().image.name, name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class CollectOrphanMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.storage = Post._meta.get_field('image').storage
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            text='Текст', author=self.author, image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF, content_type='image/gif'
+            )
+        )
+
+    def orphan(self, name, age=7200):
+        name = self.storage._save(name, SimpleUploadedFile(name, OTHER_GIF))
+        path = self.storage.path(name)
+        os.utime(path, (os.path.getmtime(path) - age,) * 2)
+        return name
+
+    def collect(self, *args):
+        output = io.StringIO()
+        call_command('collect_orphan_media', *args, stdout=output)
+        return output.getvalue()
+
+    def test_orphans_deleted(self):
+        """Удаляются старые файлы без постов, остальные остаются"""
+        orphan = self.orphan('posts/orphan.gif')
+        fresh = self.orphan('posts/fresh.gif', age=0)
+        self.collect()
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertTrue(self.storage.exists(self.post.image.name))
+
+    def test_dry_run(self):
+        """--dry-run только выводит ненужные файлы"""
+        orphan = self.orphan('posts/orphan.gif')
+        self.assertIn(orphan, self.collect('--dry-run'))
+        self.assertTrue(self.storage.exists(orphan))
+
+    def test_resume_from_checkpoint(self):
+        """Обход продолжается с позиции из файла --checkpoint"""
+        before = self.orphan('posts/a.gif')
+        after = self.orphan('posts/z.gif')
+        checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint.json')
+        with open(checkpoint, 'w') as file:
+            json.dump({'last': 'posts/b'}, file)
+        self.collect('--checkpoint', checkpoint)
+        self.assertTrue(self.storage.exists(before))
+        self.assertFalse(self.storage.exists(after))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_referenced_again_kept(self):
+        """Файл, на который загрузка успела добавить ссылку, остается"""
+        orphan = self.orphan('posts/orphan.gif')
+        StoredFile.objects.create(name=orphan, size=1, refs=1)
+        self.assertIn('ненужных: 0', self.collect())
+        self.assertTrue(self.storage.exists(orphan))
+
+    def test_orphan_thumbnails_deleted(self):
+        """Удаляются файлы миниатюр без записи в KV-хранилище"""
+        generate_thumbnails(self.post.image.name)
+        thumbnails = [
+            default.kvstore.get(default.backend.thumbnail_file(
+                ImageFile(self.post.image), geometry, dict(options)
+            )).name
+            for _, _, geometry, options in VARIANTS
+        ]
+        for name in thumbnails:
+            path = default.storage.path(name)
+            os.utime(path, (os.path.getmtime(path) - 7200,) * 2)
+        orphan = self.orphan('cache/ab/cd/orphan.jpg')
+        self.collect()
+        self.assertFalse(default.storage.exists(orphan))
+        for name in thumbnails:
+            self.assertTrue(default.storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_SENDFILE=None)
+class ServeMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.storage = Post._meta.get_field('image').storage
+        cls.name = cls.storage.save(
+            'posts/small.gif', SimpleUploadedFile('small.gif', SMALL_GIF)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, path=None, **headers):
+        request = RequestFactory().get('/media/', **headers)
+        return serve_media(request, path or self.name)
+
+    def test_whole_file(self):
+        """Файл отдается целиком с ETag и вечным кэшированием"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Content-Length'], str(len(SMALL_GIF)))
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+
+    def test_range(self):
+        """Заголовок Range возвращает часть файла"""
+        cases = (
+            ('bytes=0-5', 0, 6),
+            ('bytes=10-', 10, len(SMALL_GIF) - 10),
+            ('bytes=-3', len(SMALL_GIF) - 3, 3),
+        )
+        for header, start, length in cases:
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    SMALL_GIF[start:start + length]
+                )
+                self.assertEqual(response['Content-Range'], 'bytes {}-{}/{}'
+                                 .format(start, start + length - 1,
+                                         len(SMALL_GIF)))
+        self.assertEqual(self.get(HTTP_RANGE='bytes=1000-').status_code, 416)
+        self.assertEqual(
+            self.get(HTTP_RANGE='bytes=0-5', HTTP_IF_RANGE='"old"')
+            .status_code, 200
+        )
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect(self):
+        """С MEDIA_SENDFILE файл отдает фронтовой сервер"""
+        response = self.get()
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + self.name
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_outside_media_root(self):
+        """Пути вне MEDIA_ROOT и каталоги не отдаются"""
+        for path in ('../settings.py', 'posts'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    self.get(path)
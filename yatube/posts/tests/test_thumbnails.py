@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from core.cache import get_version
+from posts.models import Post, User
+from posts.templatetags.post_images import post_image
+from posts.thumbnails import (VARIANTS, WIDTHS, prefetch_thumbnails,
+                              run_in_worker)
+from posts.versions import FEED
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+CREATE_URL = reverse('posts:post_create')
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class EagerThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def create_post(self, name):
+        self.client.post(CREATE_URL, {
+            'text': 'пост с картинкой',
+            'image': SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        })
+        return Post.objects.latest('pk')
+
+    def thumbnails(self, post):
+        return [
+            default.backend.get_thumbnail(post.image, geometry, **options)
+            for _, _, geometry, options in VARIANTS
+        ]
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnails_built_on_upload(self):
+        """Все варианты изображения строятся при создании поста"""
+        with mock.patch('posts.thumbnails.ThumbnailBackend.get_thumbnail',
+                        autospec=True) as build:
+            post = self.create_post('built.gif')
+        self.assertEqual(build.call_count, len(VARIANTS))
+        build.assert_called_with(
+            default.backend, mock.ANY, VARIANTS[-1][2], **VARIANTS[-1][3]
+        )
+        for thumbnail in self.thumbnails(post):
+            self.assertNotEqual(thumbnail.name, post.image.name)
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_original_image_until_built(self):
+        """Пока миниатюры строятся, шаблоны получают исходное изображение"""
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            post = self.create_post('pending.gif')
+            self.assertEqual(
+                [thumbnail.url for thumbnail in self.thumbnails(post)],
+                [post.image.url] * len(VARIANTS)
+            )
+        schedule.assert_called_with(post.image.name)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_prefetch_thumbnails(self):
+        """Миниатюры страницы читаются одним get_many и одним запросом"""
+        posts = [self.create_post(f'page{i}.gif') for i in range(3)]
+        posts.append(Post.objects.create(text='без картинки',
+                                         author=self.author))
+        expected = [thumbnail.url for post in posts[:3]
+                    for thumbnail in self.thumbnails(post)]
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch_thumbnails(posts)
+        self.assertEqual(
+            [post.variants[width, image_format].url for post in posts[:3]
+             for width, image_format, _, _ in VARIANTS],
+            expected
+        )
+        self.assertEqual(posts[3].variants, {})
+        with self.assertNumQueries(0):
+            prefetch_thumbnails(posts)
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_post_image_srcset(self):
+        """Тег post_image выводит все ширины в srcset"""
+        post = self.create_post('srcset.gif')
+        context = post_image(post)
+        self.assertEqual(
+            context['srcset'].count('w, ') + 1, len(WIDTHS)
+        )
+        for width in WIDTHS:
+            self.assertIn(f' {width}w', context['srcset'])
+        self.assertIn('srcset=', self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        ).content.decode())
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_post_image_fallback(self):
+        """Пока варианты не построены, тег выводит исходное изображение"""
+        with mock.patch('posts.thumbnails.schedule'):
+            post = self.create_post('fallback.gif')
+            self.assertEqual(post_image(post), {'src': post.image.url})
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_versions_bumped_when_built(self):
+        """Готовые миниатюры обновляют версии поста и лент"""
+        with mock.patch('posts.thumbnails.schedule'):
+            post = self.create_post('bumped.gif')
+        versions = [get_version(f'post:{post.pk}'), get_version(FEED)]
+        with mock.patch('posts.thumbnails.connection'):
+            run_in_worker(post.image.name)
+        self.assertNotEqual(
+            [get_version(f'post:{post.pk}'), get_version(FEED)], versions
+        )
@@ -0,0 +1,146 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.utils import object_cursor
+from posts.models import Follow, Post, TimelineEntry, User
+from posts.timeline import CacheTimeline, DBTimeline
+
+AUTHOR = 'author'
+AUTHOR_2 = 'author_2'
+FOLLOWER = 'follower'
+
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+FOLLOW_URL = reverse('posts:profile_follow', kwargs={'username': AUTHOR})
+UNFOLLOW_URL = reverse('posts:profile_unfollow', kwargs={'username': AUTHOR})
+
+
+class DBTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.author_2 = User.objects.create_user(username=AUTHOR_2)
+        cls.follower = User.objects.create_user(username=FOLLOWER)
+        Post.objects.create(text='старый пост', author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.follower)
+        cache.clear()
+
+    def feed(self):
+        return list(
+            self.client.get(FOLLOW_INDEX_URL).context['page_obj']
+        )
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка заполняет ленту, отписка очищает ее"""
+        self.client.get(FOLLOW_URL)
+        self.assertEqual(
+            self.feed(), list(Post.objects.filter(author=self.author))
+        )
+        self.client.get(UNFOLLOW_URL)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.follower))
+        self.assertEqual(self.feed(), [])
+
+    def test_new_post_pushed_to_followers(self):
+        """Новый пост раскладывается в ленты подписчиков"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='новый пост', author=self.author)
+        Post.objects.create(text='чужой пост', author=self.author_2)
+        self.assertEqual(self.feed()[0], post)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.follower).count(), 2
+        )
+
+    def test_timeline_is_capped(self):
+        """В ленте хранится не больше TIMELINE_LENGTH записей"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        timeline = DBTimeline(length=3)
+        for i in range(5):
+            timeline.push(
+                Post.objects.create(text=f'пост {i}', author=self.author_2),
+                [self.follower.pk]
+            )
+        self.assertEqual(
+            list(timeline.posts(self.follower).values_list(
+                'text', flat=True)),
+            ['пост 4', 'пост 3', 'пост 2']
+        )
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=2)
+    def test_celebrity_posts_pulled_on_read(self):
+        """Посты популярного автора не раскладываются, а сливаются
+        с лентой при чтении"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.author_2, author=self.author)
+        Follow.objects.create(user=self.follower, author=self.author_2)
+        # Список популярных авторов кэшируется, сбрасываем его
+        cache.clear()
+        posts = [
+            Post.objects.create(text='пост популярного', author=self.author),
+            Post.objects.create(text='обычный пост', author=self.author_2),
+            Post.objects.create(text='еще пост популярного',
+                                author=self.author),
+        ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(post__in=posts[::2])
+        )
+        self.assertEqual(self.feed()[:3], posts[::-1])
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=2)
+    def test_celebrity_feed_cursor_pages(self):
+        """Лента с популярным автором листается по курсору"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.author_2, author=self.author)
+        Follow.objects.create(user=self.follower, author=self.author_2)
+        cache.clear()
+        for i in range(12):
+            Post.objects.create(
+                text=f'пост {i}', author=(self.author, self.author_2)[i % 2]
+            )
+        posts = list(Post.objects.filter(
+            author__in=(self.author, self.author_2)
+        ).order_by('-pub_date', '-pk'))
+        page_obj = self.client.get(FOLLOW_INDEX_URL).context['page_obj']
+        self.assertEqual(list(page_obj), posts[:10])
+        page_obj = self.client.get(
+            FOLLOW_INDEX_URL + '?after=' + object_cursor(
+                page_obj.object_list[-1], DBTimeline.cursor_fields
+            )
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), posts[10:])
+        self.assertFalse(page_obj.has_next())
+        page_obj = self.client.get(
+            FOLLOW_INDEX_URL + '?before=' + page_obj.previous_cursor
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), posts[:10])
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=2)
+    def test_demoted_author_posts_kept(self):
+        """Посты, опубликованные, пока автор был популярным, остаются
+        в ленте после того, как подписчиков стало меньше порога"""
+        Follow.objects.create(user=self.author_2, author=self.author)
+        Follow.objects.create(user=self.follower, author=self.author)
+        cache.clear()
+        post = Post.objects.create(text='пока популярный', author=self.author)
+        self.assertIn(post, self.feed())
+        Follow.objects.filter(user=self.author_2).delete()
+        self.assertIn(post, self.feed())
+        new_post = Post.objects.create(text='после', author=self.author)
+        self.assertEqual(self.feed()[:2], [new_post, post])
+
+    @override_settings(TIMELINE_BACKEND='posts.timeline.CacheTimeline')
+    def test_cache_timeline(self):
+        """Лента в кэше собирается при чтении и обновляется при записи"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(len(self.feed()), 1)
+        post = Post.objects.create(text='новый пост', author=self.author)
+        self.assertIn(
+            -post.pk,
+            [pk for _, pk in cache.get(CacheTimeline().key(self.follower.pk))]
+        )
+        self.assertEqual(self.feed()[0], post)
+        post.delete()
+        self.assertEqual(len(self.feed()), 1)
@@ -13,6 +13,7 @@ INDEX_URL = reverse('posts:index')
 GROUP_LIST_URL = reverse('posts:group_list', kwargs={'slug': GROUP_SLUG})
 PROFILE_URL = reverse('posts:profile', kwargs={'username': AUTHOR_USER})
 CREATE_URL = reverse('posts:post_create')
+SEARCH_URL = reverse('posts:search')
 PAGE_404 = '/unexisting_page/'
 AUTH_URL = '/auth/login/?next=/create/'
 DETAIL_NAME = 'posts:post_detail'
@@ -55,7 +56,10 @@ class PostsURLTest(TestCase):
 
     def test_posts_pages_available_to_all(self):
         """Страница доступна любому пользователю"""
-        urls = (INDEX_URL, GROUP_LIST_URL, PROFILE_URL, self.DETAIL_URL)
+        urls = (
+            INDEX_URL, GROUP_LIST_URL, PROFILE_URL, self.DETAIL_URL,
+            SEARCH_URL
+        )
         for url in urls:
             with self.subTest(url=url):
                 self.assertEqual(
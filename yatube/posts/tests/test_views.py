@@ -9,6 +9,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from core.utils import CachedCountPaginator, encode_cursor
 from posts.models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -114,8 +115,67 @@ class PostsContextTest(TestCase):
                     'Неправильно работает паджинатор'
                 )
 
+    def test_cursor_paginator(self):
+        """Курсорный паджинатор листает ленту без пропусков и повторов"""
+        posts = list(Post.objects.order_by('-pub_date', '-id'))
+        page_obj = self.client.get(
+            INDEX_URL + '?after=' + encode_cursor(posts[0].pub_date,
+                                                  posts[0].id)
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), posts[1:11])
+        self.assertTrue(page_obj.has_previous())
+        page_obj = self.client.get(
+            INDEX_URL + '?after=' + page_obj.next_cursor
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), posts[11:])
+        self.assertIsNone(page_obj.next_cursor)
+        page_obj = self.client.get(
+            INDEX_URL + '?before=' + page_obj.previous_cursor
+        ).context['page_obj']
+        self.assertEqual(list(page_obj), posts[1:11])
+        page_obj = self.client.get(
+            PROFILE_URL + '?after=' + encode_cursor(posts[5].pub_date,
+                                                    posts[5].id)
+        ).context['page_obj']
+        self.assertEqual(
+            list(page_obj),
+            [post for post in posts[6:] if post.author == self.user_1]
+        )
+
+    def test_page_links_use_cursor(self):
+        """Ссылки Следующая/Предыдущая страницы с номером - курсорные"""
+        cache.clear()
+        posts = list(Post.objects.order_by('-pub_date', '-id'))
+        response = self.client.get(INDEX_URL)
+        next_url = '?after=' + encode_cursor(posts[9].pub_date, posts[9].id)
+        self.assertContains(response, next_url)
+        self.assertEqual(
+            list(self.client.get(INDEX_URL + next_url).context['page_obj']),
+            posts[10:20]
+        )
+        response = self.client.get(INDEX_URL + PAGE_2)
+        self.assertContains(
+            response,
+            '?before=' + encode_cursor(posts[10].pub_date, posts[10].id)
+        )
+
+    def test_paginator_page_window(self):
+        """Паджинатор выводит ограниченное окно номеров страниц"""
+        paginator = CachedCountPaginator(list(range(100)), 1)
+        paginator.get_page(50)
+        self.assertEqual(
+            paginator.page_window,
+            [1, None, 47, 48, 49, 50, 51, 52, 53, None, 100]
+        )
+        paginator.get_page(2)
+        self.assertEqual(paginator.page_window, [1, 2, 3, 4, 5, None, 100])
+        self.assertEqual(paginator.get_page(1000).number, 100)
+        self.assertFalse(paginator.get_page(100).has_next())
+
     def page_obj_check(self, url, post_list):
         """Функция проверки объекта контекста page_obj"""
+        # Контекст есть только у отрисованной, а не закэшированной страницы
+        cache.clear()
         page_obj_list = (
             self.client.get(url).context['page_obj'].paginator.object_list
         )
@@ -128,6 +188,7 @@ class PostsContextTest(TestCase):
         """Функция проверки объектов моделей, переданных в context"""
         for key in obj_db:
             with self.subTest(fild=key):
+                cache.clear()
                 self.assertEqual(
                     obj_db[key],
                     getattr(self.client.get(url).context.get(inst), key))
@@ -227,7 +288,8 @@ class PostsContextTest(TestCase):
     def test_index_page_cache(self):
         """Список постов главной страницы хранится в кэше"""
         index_content = self.client.get(INDEX_URL).content
-        Post.objects.all().delete()
+        # Массовое изменение в обход сигналов не сбрасывает кэш
+        Post.objects.update(text='Изменено в обход сигналов')
         self.assertEqual(
             index_content, self.client.get(INDEX_URL).content,
             'страница не сохраняется в кэше'
@@ -238,6 +300,15 @@ class PostsContextTest(TestCase):
             'после очистки кэша страница доступна'
         )
 
+    def test_index_page_cache_invalidation(self):
+        """Удаление поста сразу сбрасывает кэш главной страницы"""
+        index_content = self.client.get(INDEX_URL).content
+        Post.objects.all().delete()
+        self.assertNotEqual(
+            index_content, self.client.get(INDEX_URL).content,
+            'удаленные посты остаются на странице'
+        )
+
     def test_follow_index_page(self):
         """Новая запись автора появляется в ленте подписчиков"""
         self.client_follower.get(FOLLOW_URL)
@@ -0,0 +1,216 @@
+"""Миниатюры изображений постов строятся при загрузке, а не в запросе.
+
+post_create и post_edit ставят построение всех вариантов из VARIANTS
+(несколько ширин в WebP и JPEG) в пул фоновых потоков. Бэкенд sorl
+EagerThumbnailBackend в шаблонах только ищет готовую миниатюру: пока
+ее нет, {% thumbnail %} получает исходное изображение, а построение
+ставится в очередь. Когда миниатюры готовы, сигнал thumbnails_ready
+обновляет версии страниц с этим изображением.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connection, transaction
+from django.dispatch import Signal
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Ширины вариантов изображения поста и пропорции кадра
+WIDTHS = (320, 640, 960)
+FRAME = (960, 339)
+# WebP, если Pillow собран с ним, и JPEG для остальных браузеров
+FORMATS = ('WEBP', 'JPEG') if features.check('webp') else ('JPEG',)
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+CROP_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def geometry(width):
+    return '{}x{}'.format(width, round(width * FRAME[1] / FRAME[0]))
+
+
+# Все варианты, которые выводят шаблоны:
+# (ширина, формат, геометрия, параметры get_thumbnail)
+VARIANTS = tuple(
+    (width, image_format, geometry(width),
+     {**CROP_OPTIONS, 'format': image_format})
+    for image_format in FORMATS for width in WIDTHS
+)
+# Сколько секунд не ставить повторно в очередь одно изображение
+SCHEDULE_LOCK_TIME = 60
+
+# Миниатюры изображения name построены в фоне
+thumbnails_ready = Signal(providing_args=['name'])
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def image_file(name):
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate_thumbnails(name):
+    """Строит все варианты изображения name, которых еще нет."""
+    for _, _, geometry_string, options in VARIANTS:
+        default.backend.generate(image_file(name), geometry_string, **options)
+
+
+def release_image(name):
+    """Снимает ссылку поста на изображение. Вместе с последней ссылкой
+    удаляются файл и его миниатюры."""
+    storage = Post._meta.get_field('image').storage
+    try:
+        storage.delete(name)
+        if not storage.exists(name):
+            default.kvstore.delete(image_file(name))
+    except (OSError, SuspiciousFileOperation):
+        # Пост уже удален: ошибка файла не должна ломать запрос
+        logger.exception('Не удалось освободить изображение %s', name)
+
+
+def run_in_worker(name):
+    try:
+        generate_thumbnails(name)
+        thumbnails_ready.send(sender=Post, name=name)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+    finally:
+        cache.delete(f'thumbnails_scheduled:{name}')
+        connection.close()
+
+
+def schedule_thumbnails(image):
+    """Ставит построение миниатюр image в очередь. При
+    THUMBNAIL_WORKERS = 0 миниатюры строятся сразу."""
+    if image:
+        schedule(image.name)
+
+
+def schedule(name):
+    if not settings.THUMBNAIL_WORKERS:
+        generate_thumbnails(name)
+        return
+    if cache.add(f'thumbnails_scheduled:{name}', 1, SCHEDULE_LOCK_TIME):
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_worker, name)
+        )
+
+
+def fetch_kvstore(keys):
+    """Значения KV-хранилища sorl для keys: одним get_many к кэшу
+    и одним запросом к базе для промахов."""
+    kvstore = default.kvstore
+    if not keys:
+        return {}
+    if not hasattr(kvstore, 'cache'):
+        # Хранилище без кэша перед базой: читаем по одному ключу
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing).values_list('key', 'value')
+        )
+        kvstore.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    return {
+        key: value for key, value in values.items()
+        if value and value is not EMPTY_VALUE
+    }
+
+
+def prefetch_thumbnails(posts):
+    """Кладет в post.variants готовые варианты изображения каждого поста
+    {(ширина, формат): миниатюра}, читая их для всей страницы разом.
+    Если каких-то вариантов еще нет, post.thumbnail_ready = False,
+    а их построение ставится в очередь."""
+    backend = default.backend
+    # У разных постов может быть одно изображение
+    keys = defaultdict(list)
+    for post in posts:
+        post.variants, post.thumbnail_ready = {}, True
+        if not post.image:
+            continue
+        source = ImageFile(post.image)
+        for width, image_format, geometry_string, options in VARIANTS:
+            thumbnail = backend.thumbnail_file(
+                source, geometry_string, dict(options)
+            )
+            keys[add_prefix(thumbnail.key)].append(
+                (post, width, image_format, geometry_string, options)
+            )
+    values = fetch_kvstore(list(keys))
+    for key, variants in keys.items():
+        for post, width, image_format, geometry_string, options in variants:
+            if key in values:
+                thumbnail = deserialize_image_file(values[key])
+            elif settings.THUMBNAIL_WORKERS:
+                post.thumbnail_ready = False
+                schedule(post.image.name)
+                continue
+            else:
+                thumbnail = backend.generate(
+                    ImageFile(post.image), geometry_string, **options
+                )
+            post.variants[width, image_format] = thumbnail
+    return posts
+
+
+class EagerThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который в запросе не строит миниатюры."""
+
+    def thumbnail_file(self, source, geometry_string, options):
+        """Файл миниатюры с теми же параметрами, что и в get_thumbnail."""
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return ImageFile(
+            self._get_thumbnail_filename(source, geometry_string, options),
+            default.storage
+        )
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра или, пока ее нет, исходное изображение."""
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        cached = default.kvstore.get(
+            self.thumbnail_file(source, geometry_string, dict(options))
+        )
+        if cached:
+            return cached
+        if not settings.THUMBNAIL_WORKERS:
+            return self.generate(source, geometry_string, **options)
+        schedule(source.name)
+        return source
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
@@ -0,0 +1,325 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в ленты подписчиков автора при сохранении,
+подписка добавляет в ленту последние посты автора, отписка их убирает.
+Каждая лента ограничена TIMELINE_LENGTH последними записями, так что
+follow_index читает один диапазон индекса вместо JOIN через Follow.
+
+Посты авторов, у которых не меньше TIMELINE_CELEBRITY_THRESHOLD
+подписчиков, не раскладываются по лентам: они дочитываются при
+открытии ленты и сливаются с ней k-way merge по дате публикации.
+Из каждого источника читается только одна страница после курсора.
+"""
+import heapq
+from bisect import insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Subquery
+from django.utils.module_loading import import_string
+
+from core.utils import seek
+
+from .models import AuthorStats, Follow, Post, TimelineEntry, User
+
+# Сколько подписчиков обрабатывать за один INSERT/DELETE
+BATCH_SIZE = 500
+# Сколько секунд хранить в кэше список популярных авторов
+CELEBRITIES_CACHE_TIME = 60 * 5
+
+
+def follower_ids(author_id):
+    return Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+
+
+def batches(ids, size=BATCH_SIZE):
+    batch = []
+    for item in ids:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def merge_feeds(feeds, limit, key, reverse=True):
+    """k-way merge лент, отсортированных по key, без повторов постов."""
+    seen = set()
+    merged = []
+    for post in heapq.merge(*feeds, key=key, reverse=reverse):
+        if post.pk in seen:
+            continue
+        seen.add(post.pk)
+        merged.append(post)
+        if len(merged) == limit:
+            break
+    return merged
+
+
+class MergedFeed:
+    """Лента, слитая из нескольких QuerySet с общим ключом сортировки
+    fields. Страница собирается из не более чем limit первых строк
+    каждого источника после курсора, а не из лент целиком."""
+
+    def __init__(self, sources, fields):
+        self.sources = sources
+        self.fields = fields
+
+    def key(self, post):
+        field, tiebreak = self.fields
+        return getattr(post, field), getattr(post, tiebreak)
+
+    def seek(self, after=None, before=None, limit=None):
+        return merge_feeds(
+            [
+                seek(source, self.fields, after, before, limit)
+                for source in self.sources
+            ],
+            limit, self.key, reverse=not before
+        )
+
+    def __getitem__(self, index):
+        # Срез для страниц с номером: каждому источнику хватает
+        # index.stop первых строк
+        return merge_feeds(
+            [source[:index.stop] for source in self.sources],
+            index.stop, self.key
+        )[index]
+
+    def __len__(self):
+        # Оценка сверху: пост может быть и в ленте, и среди дочитанных
+        return sum(source.count() for source in self.sources)
+
+
+class BaseTimeline:
+    """Общая часть хранилищ лент: выбор между push и pull по числу
+    подписчиков автора и слияние ленты с постами популярных авторов."""
+    cursor_fields = ('pub_date', 'pk')
+
+    def __init__(self, length=None, threshold=None):
+        self.length = length or settings.TIMELINE_LENGTH
+        self.threshold = (
+            threshold or settings.TIMELINE_CELEBRITY_THRESHOLD
+        )
+
+    def celebrities_key(self):
+        return f'timeline_celebrities:{self.threshold}'
+
+    def celebrity_ids(self):
+        key = self.celebrities_key()
+        ids = cache.get(key)
+        if ids is None:
+            ids = set(
+                AuthorStats.objects.filter(
+                    followers_count__gte=self.threshold
+                ).values_list('user_id', flat=True)
+            )
+            cache.set(key, ids, CELEBRITIES_CACHE_TIME)
+        return ids
+
+    def push(self, post, user_ids=None):
+        if user_ids is None:
+            if post.author_id in self.celebrity_ids():
+                return
+            user_ids = follower_ids(post.author_id).iterator()
+        self.push_to(post, user_ids)
+
+    def backfill(self, user_id, author_id):
+        if author_id not in self.celebrity_ids():
+            self.backfill_from(user_id, author_id)
+
+    def unfollowed(self, author_id):
+        """Отписка, после которой у автора стало меньше threshold
+        подписчиков: его посты снова раскладываются по лентам, а в ленты
+        подписчиков добавляются посты, которые раньше дочитывались."""
+        followers = AuthorStats.objects.filter(user_id=author_id).values_list(
+            'followers_count', flat=True
+        ).first()
+        if followers != self.threshold - 1:
+            return
+        cache.delete(self.celebrities_key())
+        for user_id in follower_ids(author_id).iterator():
+            self.backfill_from(user_id, author_id)
+
+    def pulled_entries(self, user_id):
+        """Последние посты не популярных авторов из подписок:
+        (дата публикации, id поста) в порядке убывания."""
+        return Post.objects.filter(
+            author__following__user_id=user_id
+        ).exclude(
+            author_id__in=self.celebrity_ids()
+        ).order_by('-pub_date', '-pk').values_list(
+            'pub_date', 'pk'
+        )[:self.length]
+
+    def author_posts(self, author_id):
+        """Посты популярного автора с полями ключа ленты cursor_fields."""
+        return Post.objects.select_related('group', 'author').filter(
+            author_id=author_id
+        ).order_by('-pub_date', '-pk')
+
+    def posts(self, user):
+        """Лента пользователя: QuerySet, если он не подписан на популярных
+        авторов, иначе MergedFeed из ленты и их постов."""
+        pushed = self.pushed_posts(user)
+        celebrities = list(Follow.objects.filter(
+            user=user, author_id__in=self.celebrity_ids()
+        ).values_list('author_id', flat=True))
+        if not celebrities:
+            return pushed
+        return MergedFeed(
+            [pushed] + [
+                self.author_posts(author_id) for author_id in celebrities
+            ],
+            self.cursor_fields
+        )
+
+
+class DBTimeline(BaseTimeline):
+    """Ленты в таблице TimelineEntry с индексом (user, pub_date, post)."""
+    cursor_fields = ('feed_date', 'feed_post')
+
+    def push_to(self, post, user_ids):
+        for batch in batches(user_ids):
+            TimelineEntry.objects.bulk_create(
+                [
+                    TimelineEntry(
+                        user_id=user_id, post=post, pub_date=post.pub_date
+                    )
+                    for user_id in batch
+                ],
+                ignore_conflicts=True
+            )
+            self.trim(batch)
+
+    def trim(self, user_ids):
+        """Обрезает до TIMELINE_LENGTH записей ленты user_ids, которые
+        переросли предел больше чем на десятую часть: так удаление
+        выполняется не на каждый новый пост."""
+        def entry_date(number):
+            return Subquery(
+                TimelineEntry.objects.filter(
+                    user=OuterRef('pk')
+                ).order_by('-pub_date').values('pub_date')[number - 1:number]
+            )
+
+        overgrown = User.objects.filter(pk__in=user_ids).annotate(
+            overflow=entry_date(self.length + self.length // 10 + 1)
+        ).exclude(overflow=None).annotate(
+            oldest_kept=entry_date(self.length)
+        ).values_list('pk', 'oldest_kept')
+        for user_id, oldest_kept in overgrown:
+            TimelineEntry.objects.filter(
+                user_id=user_id, pub_date__lt=oldest_kept
+            ).delete()
+
+    def backfill_from(self, user_id, author_id):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pub_date, pk in Post.objects.filter(
+                    author_id=author_id
+                ).order_by('-pub_date').values_list(
+                    'pub_date', 'pk'
+                )[:self.length]
+            ],
+            ignore_conflicts=True
+        )
+        self.trim([user_id])
+
+    def remove_author(self, user_id, author_id):
+        TimelineEntry.objects.filter(
+            user_id=user_id, post__author_id=author_id
+        ).delete()
+
+    def remove_post(self, post):
+        # Записи ленты удаляются каскадно вместе с постом
+        pass
+
+    def rebuild(self, user_id):
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pub_date, pk in self.pulled_entries(user_id)
+        )
+
+    def author_posts(self, author_id):
+        return super().author_posts(author_id).annotate(
+            feed_date=F('pub_date'), feed_post=F('pk')
+        ).order_by('-feed_date', '-feed_post')
+
+    def pushed_posts(self, user):
+        return Post.objects.select_related('group', 'author').filter(
+            timeline_entries__user=user
+        ).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_post=F('timeline_entries__post')
+        ).order_by('-feed_date', '-feed_post')
+
+
+class CacheTimeline(BaseTimeline):
+    """Ленты в кэше: список (timestamp, id поста) по убыванию.
+    Отсутствующая лента собирается из базы при первом чтении."""
+    key_prefix = 'timeline'
+
+    def key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def update(self, user_ids, change):
+        for batch in batches(user_ids):
+            keys = {self.key(user_id): user_id for user_id in batch}
+            timelines = cache.get_many(keys)
+            for key, entries in timelines.items():
+                timelines[key] = change(entries)[:self.length]
+            cache.set_many(timelines, None)
+
+    def push_to(self, post, user_ids):
+        entry = (-post.pub_date.timestamp(), -post.pk)
+
+        def add(entries):
+            if entry not in entries:
+                insort(entries, entry)
+            return entries
+
+        # Ленты, которых нет в кэше, соберутся при чтении
+        self.update(user_ids, add)
+
+    def backfill_from(self, user_id, author_id):
+        cache.delete(self.key(user_id))
+
+    def remove_author(self, user_id, author_id):
+        cache.delete(self.key(user_id))
+
+    def remove_post(self, post):
+        self.update(
+            follower_ids(post.author_id).iterator(),
+            lambda entries: [
+                entry for entry in entries if entry[1] != -post.pk
+            ]
+        )
+
+    def rebuild(self, user_id):
+        entries = [
+            (-pub_date.timestamp(), -pk)
+            for pub_date, pk in self.pulled_entries(user_id)
+        ]
+        cache.set(self.key(user_id), entries, None)
+        return entries
+
+    def post_ids(self, user_id):
+        entries = cache.get(self.key(user_id))
+        if entries is None:
+            entries = self.rebuild(user_id)
+        return [-pk for _, pk in entries]
+
+    def pushed_posts(self, user):
+        return Post.objects.select_related('group', 'author').filter(
+            pk__in=self.post_ids(user.pk)
+        ).order_by('-pub_date', '-pk')
+
+
+def get_timeline():
+    return import_string(settings.TIMELINE_BACKEND)()
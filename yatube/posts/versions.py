@@ -0,0 +1,80 @@
+"""Имена версий закэшированных страниц лент (см. core.cache)."""
+import hashlib
+
+from django.conf import settings
+from django.db.models import F
+
+from core.cache import bump_versions, get_versions
+
+from .cards import version_names
+from .models import Follow, Post
+from .timeline import batches, follower_ids, get_timeline
+
+# Главная страница: все посты
+FEED = 'feed'
+# Страница группы
+GROUP_FEED = 'group_feed:{slug}'
+# Страница автора
+PROFILE = 'profile:{username}'
+# Лента подписок пользователя
+FOLLOW_FEED = 'follow_feed:{user_id}'
+# Посты популярного автора: смена этой версии не рассылается по лентам
+# его подписчиков, ленты сами читают версии своих популярных авторов
+AUTHOR_POSTS = 'author_posts:{author_id}'
+# Сколько секунд хранить страницы лент: устаревшими их делает смена версии
+FEED_CACHE_TIME = 60 * 60
+
+
+def bump_feeds(group_slugs=(), usernames=(), feed=True):
+    bump_versions(
+        *([FEED] if feed else []),
+        *(GROUP_FEED.format(slug=slug) for slug in group_slugs if slug),
+        *(PROFILE.format(username=username) for username in usernames)
+    )
+
+
+def bump_follow_feeds(user_ids):
+    for batch in batches(user_ids):
+        bump_versions(
+            *(FOLLOW_FEED.format(user_id=user_id) for user_id in batch)
+        )
+
+
+def bump_follower_feeds(author_id):
+    """Ленты подписок подписчиков автора. У популярного автора
+    (см. posts.timeline) меняется одна версия AUTHOR_POSTS, у остальных -
+    версии лент подписчиков по индексу Follow (author, user)."""
+    bump_versions(AUTHOR_POSTS.format(author_id=author_id))
+    if author_id not in get_timeline().celebrity_ids():
+        bump_follow_feeds(follower_ids(author_id).iterator())
+
+
+def followed_celebrity_scopes(request, **kwargs):
+    """Версии AUTHOR_POSTS популярных авторов из подписок пользователя
+    для ключа его ленты подписок."""
+    celebrities = get_timeline().celebrity_ids()
+    if not celebrities:
+        return []
+    return [
+        AUTHOR_POSTS.format(author_id=author_id)
+        for author_id in Follow.objects.filter(
+            user=request.user, author_id__in=celebrities
+        ).order_by('author_id').values_list('author_id', flat=True)
+    ]
+
+
+def post_detail_etag(request, post_id):
+    """ETag страницы поста: версии карточки, число комментариев и постов
+    автора, пользователь и CSRF-cookie, от которой зависит форма."""
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'group_id', 'comments_count'
+    ).annotate(posts_count=F('author__stats__posts_count')).first()
+    if post is None:
+        return None
+    versions = get_versions(version_names(post))
+    raw = ':'.join(map(str, [
+        *(versions[name] for name in version_names(post)),
+        post.comments_count, post.posts_count, request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    ]))
+    return hashlib.md5(raw.encode()).hexdigest()
@@ -1,47 +1,64 @@
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
+from core.cache import cache_page_versioned
+from core.db_router import use_replica
 from core.utils import get_page_obj
 
+from .cards import attach_cards
+from .counters import get_author_stats
+from .export import export_stream
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .search import search_available, search_posts
+from .thumbnails import prefetch_thumbnails, schedule_thumbnails
+from .timeline import get_timeline
+from .versions import (FEED, FEED_CACHE_TIME, FOLLOW_FEED, GROUP_FEED,
+                       PROFILE, followed_celebrity_scopes, post_detail_etag)
 
 POSTS_ON_PAGE = 10
 
 
 # Главная страница
-@cache_page(20, key_prefix='index_page')
+@cache_page_versioned(FEED_CACHE_TIME, FEED)
 def index(request):
-    return render(request, 'posts/index.html', {
-        'page_obj': get_page_obj(
-            Post.objects.select_related('group', 'author').all(),
-            POSTS_ON_PAGE, request
-        )
-    }
+    page_obj = get_page_obj(
+        Post.objects.select_related('group', 'author').all(),
+        POSTS_ON_PAGE, request
     )
+    attach_cards(page_obj.object_list)
+    return render(request, 'posts/index.html', {'page_obj': page_obj})
 
 
 # Посты, отфильтрованные по группам
+@cache_page_versioned(FEED_CACHE_TIME, GROUP_FEED)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
+    page_obj = get_page_obj(
+        group.posts.select_related('author').all(), POSTS_ON_PAGE, request
+    )
+    attach_cards(page_obj.object_list)
     return render(request, 'posts/group_list.html', {
         'group': group,
-        'page_obj': get_page_obj(
-            group.posts.select_related('author').all(), POSTS_ON_PAGE, request
-        )
+        'page_obj': page_obj
     }
     )
 
 
 # Персональная страница пользователя
+@cache_page_versioned(FEED_CACHE_TIME, PROFILE)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
+    page_obj = get_page_obj(
+        author.posts.select_related('group').all(), POSTS_ON_PAGE, request
+    )
+    prefetch_thumbnails(page_obj.object_list)
     return render(request, 'posts/profile.html', {
         'author': author,
-        'page_obj': get_page_obj(
-            author.posts.select_related('group').all(), POSTS_ON_PAGE, request
-        ),
+        'stats': get_author_stats(author),
+        'page_obj': page_obj,
         'following': request.user.is_authenticated
         and request.user.username != username
         and author.following.filter(user=request.user)
@@ -50,10 +67,15 @@ def profile(request, username):
 
 
 # Страница поста
+@use_replica
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
     return render(request, 'posts/post_detail.html', {
         'post': post,
+        'stats': get_author_stats(post.author),
         'form': CommentForm()
     }
     )
@@ -71,6 +93,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    schedule_thumbnails(post.image)
     return redirect('posts:profile', username=request.user.username)
 
 
@@ -90,6 +113,8 @@ def post_edit(request, post_id):
         }
         )
     form.save()
+    if 'image' in form.changed_data:
+        schedule_thumbnails(post.image)
     return redirect('posts:post_detail', post_id=post_id)
 
 
@@ -108,17 +133,53 @@ def add_comment(request, post_id):
 
 # Посты избранных авторов
 @login_required
+@cache_page_versioned(
+    FEED_CACHE_TIME, FOLLOW_FEED, followed_celebrity_scopes
+)
 def follow_index(request):
-    return render(request, 'posts/index.html', {
-        'page_obj': get_page_obj(
-            Post.objects.select_related('group', 'author')
-            .filter(author__following__user=request.user),
-            POSTS_ON_PAGE, request
-        ),
+    timeline = get_timeline()
+    page_obj = get_page_obj(
+        timeline.posts(request.user), POSTS_ON_PAGE, request,
+        cursor_fields=timeline.cursor_fields
+    )
+    attach_cards(page_obj.object_list)
+    return render(request, 'posts/index.html', {'page_obj': page_obj})
+
+
+# Поиск по тексту постов
+@use_replica
+def search(request):
+    query = request.GET.get('q', '').strip()
+    after = request.GET.get('after')
+    posts, next_cursor = [], None
+    if query and search_available():
+        posts, next_cursor = search_posts(query, POSTS_ON_PAGE, after)
+        attach_cards(posts)
+    return render(request, 'posts/search.html', {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+        'is_continued': bool(after)
     }
     )
 
 
+# Выгрузка своих постов, комментариев и подписок
+@login_required
+def export_data(request):
+    compress = request.GET.get('compress') == 'gzip'
+    filename = f'yatube-{request.user.username}.ndjson'
+    response = StreamingHttpResponse(
+        export_stream(request.user, compress),
+        content_type='application/gzip' if compress
+        else 'application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        filename + '.gz' if compress else filename
+    )
+    return response
+
+
 # Подписаться
 @login_required
 def profile_follow(request, username):
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.db_router.PinPrimaryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,8 +91,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живет между запросами потока, а не открывается
+        # заново в каждом
+        'CONN_MAX_AGE': 600,
     }
 }
+# PRAGMA для каждого нового соединения SQLite (core.db.configure_sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Сколько миллисекунд ждать блокировку записи
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер в КиБ, а не в страницах
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Реплики только для чтения, например YATUBE_REPLICAS=replica. Локально
+# реплика - копия db.sqlite3, которую обновляет manage.py replicate_sqlite
+DATABASE_REPLICAS = [
+    alias for alias in os.environ.get('YATUBE_REPLICAS', '').split(',')
+    if alias
+]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db_{alias}.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы
+REPLICA_PIN_TIME = 10
 
 
 # Password validation
@@ -140,8 +172,44 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Раздавать медиа представлением core.views.serve_media, когда перед
+# Django нет сервера, который отдает /media/ сам
+MEDIA_SERVE = not DEBUG
+# None - файлы отдает Django, 'x-sendfile' (Apache, lighttpd) или
+# 'x-accel-redirect' (nginx, internal-location MEDIA_ACCEL_PREFIX) -
+# фронтовой сервер
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Сколько секунд кэшировать файлы с именем не по содержимому
+MEDIA_CACHE_MAX_AGE = 24 * 3600
+# Общий для всех воркеров хоста кэш в файле SQLite, путь к нему можно
+# задать в YATUBE_CACHE_LOCATION
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube_cache.sqlite3')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 }
+# Тесты получают свой файл кэша (core.test_runner)
+TEST_RUNNER = 'core.test_runner.TestRunner'
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Лента подписок: хранилище и число записей в ленте одного пользователя
+TIMELINE_BACKEND = 'posts.timeline.DBTimeline'
+TIMELINE_LENGTH = 500
+# С какого числа подписчиков посты автора не раскладываются по лентам,
+# а дочитываются при открытии ленты
+TIMELINE_CELEBRITY_THRESHOLD = 10000
+
+# Миниатюры строятся в фоновых потоках при загрузке изображения,
+# 0 - сразу в запросе (при разработке и в тестах)
+THUMBNAIL_BACKEND = 'posts.thumbnails.EagerThumbnailBackend'
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+# Загрузки крупнее этого размера пишутся во временный файл на диске
+# кусками, а не читаются в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
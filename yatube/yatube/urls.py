@@ -3,6 +3,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import serve_media
+
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.csrf_failure'
 urlpatterns = [
@@ -12,7 +14,12 @@ urlpatterns = [
     path('about/', include('about.urls', namespace='about')),
     path('', include('posts.urls', namespace='posts')),
 ]
-if settings.DEBUG:
+if settings.MEDIA_SERVE:
+    urlpatterns += [path(
+        settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media,
+        name='media'
+    )]
+elif settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
     )